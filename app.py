@@ -1,12 +1,37 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, flash, session, jsonify
-import json
+from flask import Flask, Response, g, render_template, request, redirect, url_for, send_file, flash, session, jsonify
+import functools
+import io
+import logging
 import os
-from datetime import datetime
-from pdf_generator import generate_price_tickets
+import threading
+import time
+import uuid
+from werkzeug.wsgi import ClosingIterator
+from catalog import MAX_TICKET_QUANTITY, ProductCatalog, parse_quantity, parse_rrp
+from catalog_history import CHANGE_KINDS, PRINTABLE_CHANGES, CatalogHistory, UnknownVersion, changed_product_ids
+from catalog_sqlite import SqliteProductCatalog
+from custom_upload import read_custom_tickets
+from draft_store import DraftStore
+from jobs import JobManager, JobQueueFull
+from metrics import (GENERATION_BYTES_PER_TICKET, GENERATION_ERRORS, GENERATION_PAGES, GENERATION_SECONDS,
+                     GENERATION_TICKETS, REGISTRY, REQUEST_SECONDS, STAGE_SECONDS)
+from pdf_cache import PdfCache, render_cached
+from static_assets import StaticAssets
+from ticket_backends import OUTPUT_BACKENDS, ZplBackend
+from text_layout import LAYOUT_CACHE_SIZE, font_metrics
+from pdf_generator import (TICKET_FONT_NAME, TICKET_FONT_SIZE, generate_price_tickets, layout_ticket_name, logo_image,
+                           ticket_count, ticket_grid)
+from ticket_output import OUTPUT_MODES, download_name, iter_chunks, sweep_output_dir, write_output_file
 
-app = Flask(__name__)
+# Static files are served by the asset layer below rather than Flask's built-in route
+app = Flask(__name__, static_folder=None)
 app.secret_key = 'your-secret-key-change-in-production'
 
+# Leveled logging instead of print(); set LOG_LEVEL=DEBUG for per-request detail
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+logger = logging.getLogger(__name__)
+
 # Base URL for deployment under subpath
 BASE_URL = '/rubi-price-ticket'
 
@@ -14,94 +39,309 @@ BASE_URL = '/rubi-price-ticket'
 DATA_FILE = 'products.json'
 OUTPUT_DIR = 'generated_tickets'
 
-# Ensure output directory exists
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+# How generated PDFs are returned: 'memory' (default) and 'stream' never touch
+# the disk; 'disk' keeps a copy in OUTPUT_DIR, swept by age and total size
+OUTPUT_MODE = os.environ.get('OUTPUT_MODE', 'memory')
+OUTPUT_MAX_AGE_SECONDS = int(os.environ.get('OUTPUT_MAX_AGE_SECONDS', str(24 * 60 * 60)))
+OUTPUT_MAX_BYTES = int(os.environ.get('OUTPUT_MAX_BYTES', str(500 * 1024 * 1024)))
+if OUTPUT_MODE not in OUTPUT_MODES:
+    raise ValueError(f'OUTPUT_MODE must be one of {", ".join(OUTPUT_MODES)}, not {OUTPUT_MODE!r}')
+
+# Parallel rendering: worker processes and the batch size at which they are used
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', '1'))
+RENDER_CHUNK_PAGES = int(os.environ.get('RENDER_CHUNK_PAGES', '0')) or None
+PARALLEL_MIN_TICKETS = int(os.environ.get('PARALLEL_MIN_TICKETS', '2000'))
+
+# Compact PDFs (binary streams, print-resolution logo) for printers on slow links
+PDF_COMPACT = os.environ.get('PDF_COMPACT', '0').lower() in ('1', 'true', 'yes')
+
+# Label printer (ZPL) output, rendered for printers of this resolution in dpi
+ZPL_DPI = int(os.environ.get('ZPL_DPI', '203'))
+label_backend = ZplBackend(dpi=ZPL_DPI)
+
+# Selections larger than this are generated as background jobs by the page
+ASYNC_TICKET_THRESHOLD = int(os.environ.get('ASYNC_TICKET_THRESHOLD', '500'))
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '2'))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', '20'))
+JOB_RESULT_TTL_SECONDS = int(os.environ.get('JOB_RESULT_TTL_SECONDS', '3600'))
+# Total size of finished job PDFs held in memory (without JOB_STATE_DIR) before the oldest are dropped
+JOB_MAX_RESULT_BYTES = int(os.environ.get('JOB_MAX_RESULT_BYTES', str(512 * 1024 * 1024)))
+# Directory shared by all server processes for job status and results (needed with
+# more than one worker process, as polls may reach a different process)
+JOB_STATE_DIR = os.environ.get('JOB_STATE_DIR') or None
+# Directory shared by all server processes for metric snapshots, so /metrics in
+# any process reports the sum over all of them (needed with more than one worker)
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+if METRICS_DIR:
+    REGISTRY.share(METRICS_DIR)
+
+# Repeat generations of the same tickets are served from this cache (LRU by total bytes)
+PDF_CACHE_MAX_BYTES = int(os.environ.get('PDF_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+pdf_cache = PdfCache(PDF_CACHE_MAX_BYTES)
+REGISTRY.register_callback('ticket_pdf_cache_hits_total', 'PDF cache hits.', lambda: pdf_cache.hits, 'counter')
+REGISTRY.register_callback('ticket_pdf_cache_misses_total', 'PDF cache misses.', lambda: pdf_cache.misses, 'counter')
+REGISTRY.register_callback('ticket_pdf_cache_bytes', 'Bytes held in the PDF cache.', lambda: pdf_cache.total_bytes)
+
+# Product catalog: 'json' (default) parses products.json once and reloads it only
+# when it changes; 'sqlite' answers every lookup with an indexed query on CATALOG_DB
+CATALOG_BACKEND = os.environ.get('CATALOG_BACKEND', 'json')
+CATALOG_DB = os.environ.get('CATALOG_DB', 'products.sqlite3')
+if CATALOG_BACKEND == 'sqlite':
+    catalog = SqliteProductCatalog(CATALOG_DB)
+elif CATALOG_BACKEND == 'json':
+    catalog = ProductCatalog(DATA_FILE)
+else:
+    raise ValueError(f'CATALOG_BACKEND must be json or sqlite, not {CATALOG_BACKEND!r}')
+
+# Every catalog version the app sees is recorded with per-product fingerprints,
+# so price changes since an earlier version can be printed on their own
+CATALOG_HISTORY_DB = os.environ.get('CATALOG_HISTORY_DB', 'catalog_history.sqlite3')
+CATALOG_HISTORY_MAX_VERSIONS = int(os.environ.get('CATALOG_HISTORY_MAX_VERSIONS', '30'))
+catalog_history = CatalogHistory(CATALOG_HISTORY_DB, max_versions=CATALOG_HISTORY_MAX_VERSIONS)
+
+
+def record_catalog_version(snapshot):
+    """Add a catalog snapshot's version to the history"""
+    try:
+        if catalog_history.record(snapshot.version, snapshot.products):
+            logger.info("Recorded catalog version %s (%d products)", snapshot.version, len(snapshot))
+    except Exception:
+        # History is an extra; a failure here must not break catalog reloads
+        logger.exception("Could not record catalog version %s", snapshot.version)
+
+
+# Threads recording reloaded catalog versions, joined by preload() before a server forks
+history_threads = []
+history_threads_lock = threading.Lock()
+
+
+def record_catalog_version_in_background(snapshot):
+    """Reload listener: record the new version without holding up the request that triggered the reload"""
+    thread = threading.Thread(target=record_catalog_version, args=(snapshot,), daemon=True)
+    with history_threads_lock:
+        history_threads[:] = [existing for existing in history_threads if existing.is_alive()]
+        history_threads.append(thread)
+    thread.start()
+
+
+def wait_for_catalog_history():
+    """Block until every background catalog version recording has finished"""
+    with history_threads_lock:
+        threads = list(history_threads)
+    for thread in threads:
+        thread.join()
+
+
+if CATALOG_BACKEND == 'json':
+    catalog.add_reload_listener(record_catalog_version_in_background)
+catalog_history.observe(catalog)
+
+# Custom tickets live server-side in a draft store; the session cookie only
+# carries the draft id, so drafts can grow past the ~4 KB cookie limit
+DRAFT_DB = os.environ.get('DRAFT_DB', 'drafts.sqlite3')
+DRAFT_TTL_SECONDS = int(os.environ.get('DRAFT_TTL_SECONDS', str(7 * 24 * 60 * 60)))
+drafts = DraftStore(DRAFT_DB, ttl_seconds=DRAFT_TTL_SECONDS)
+
+# Bulk custom ticket uploads: rows read per file and the request size limit
+CUSTOM_UPLOAD_MAX_ROWS = int(os.environ.get('CUSTOM_UPLOAD_MAX_ROWS', '5000'))
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_BYTES', str(16 * 1024 * 1024)))
+
+TICKETS_PER_PAGE = ticket_grid()['tickets_per_page']
+
+# Static files are read and compressed once at startup
+STATIC_DIR = os.path.join(app.root_path, 'static')
+static_assets = StaticAssets(STATIC_DIR, BASE_URL + '/static')
+
+# Page sizes for /api/products
+API_DEFAULT_PAGE_SIZE = 100
+API_MAX_PAGE_SIZE = 500
+
+# Ensure output directory exists when PDFs are kept on disk
+if OUTPUT_MODE == 'disk':
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # Context processor to inject base_url into all templates
 @app.context_processor
 def inject_base_url():
-    return {'base_url': BASE_URL}
-
-# Custom static file route to handle subpath deployment
-@app.route('/static/<path:filename>')
-def static_files(filename):
-    """Serve static files with the correct subpath"""
-    print(f"Serving static file: {filename}")
-    return app.send_static_file(filename)
+    return {'base_url': BASE_URL, 'async_ticket_threshold': ASYNC_TICKET_THRESHOLD,
+            'max_ticket_quantity': MAX_TICKET_QUANTITY, 'asset_url': static_assets.url}
 
 # Test route to debug
 @app.route('/test')
 def test_route():
     return "Flask app is working at subpath!"
 
-# Also handle static files without the subpath (fallback)
+# Static files, served with or without the subpath. asset_url() in templates
+# gives fingerprinted URLs that browsers cache for a year.
 @app.route('/static/<path:filename>')
-def static_fallback(filename):
-    """Fallback static file serving"""
-    print(f"Serving static file via fallback: {filename}")
-    return app.send_static_file(filename)
-
-# CSS route as a workaround for static file issues
-@app.route('/static/style.css')
-def serve_css():
-    """Serve CSS directly to bypass static file issues"""
-    try:
-        with open(os.path.join(app.static_folder, 'style.css'), 'r') as f:
-            css_content = f.read()
-        return css_content, 200, {'Content-Type': 'text/css'}
-    except FileNotFoundError:
-        return "/* CSS file not found */", 404, {'Content-Type': 'text/css'}
+@app.route(BASE_URL + '/static/<path:filename>')
+def static_files(filename):
+    """Serve a static file from memory, precompressed and with cache validators"""
+    return static_assets.response(filename)
 
 
 def load_products():
-    """Load products from JSON file (read-only)"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r') as f:
-            products = json.load(f)
-            # Sort products by quick_code in ascending order (smallest to largest)
-            return sorted(products, key=lambda x: int(x['quick_code']))
-    return []
+    """Load products from the in-memory catalog (read-only), sorted by quick_code"""
+    return catalog.products()
+
+
+def current_draft_id(create=False):
+    """Draft id from the session, or None. With create=True a new draft is started if needed."""
+    draft_id = session.get('draft_id')
+    if drafts.exists(draft_id):
+        return draft_id
+    if not create:
+        return None
+    draft_id = drafts.create()
+    session['draft_id'] = draft_id
+    session.permanent = True
+    return draft_id
+
+
+def new_custom_ticket(quick_code, name, rrp, rubi_code=None, quantity=1):
+    """Custom ticket dict with a fresh unique id"""
+    # Timestamp in milliseconds plus a random suffix, so quick successive adds never collide
+    ticket = {
+        'id': f"custom_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}",
+        'quick_code': quick_code,
+        'name': name,
+        'rrp': rrp,
+        'quantity': quantity,
+        'is_custom': True
+    }
+    if rubi_code:
+        ticket['rubi_code'] = rubi_code
+    return ticket
+
+
+def selected_products(form):
+    """
+    Catalog products for the form's product_ids[], in catalog order. A
+    quantity[<id>] field prints that product more than once. Raises
+    ValueError for an invalid quantity.
+    """
+    selected_ids = form.getlist('product_ids[]')
+    products = catalog.get_many(selected_ids)
+    for index, product in enumerate(products):
+        field = f"quantity[{product['id']}]"
+        if field in form:
+            try:
+                quantity = parse_quantity(form[field])
+            except ValueError as e:
+                raise ValueError(f"Invalid quantity for {product['quick_code']}: {e}")
+            if quantity > 1:
+                # Copy so the shared catalog entry is never modified
+                products[index] = dict(product, quantity=quantity)
+    return products
+
+
+def custom_tickets_in_draft():
+    """Custom tickets of the current session's draft, in the order they were added"""
+    return drafts.tickets(current_draft_id())
 
 
 @app.route('/')
 @app.route(BASE_URL + '/')
 def index():
-    """Main page - Display products for selection and allow custom tickets"""
-    products = load_products()
-    # Get custom tickets from session
-    custom_tickets = session.get('custom_tickets', [])
-    print(f"Base URL: {BASE_URL}")
-    print(f"Static URL would be: {BASE_URL}/static/style.css")
-    return render_template('index.html', products=products, custom_tickets=custom_tickets)
+    """Main page - Products are loaded incrementally from /api/products; custom tickets come from the draft store"""
+    product_count = catalog.count()
+    custom_tickets = custom_tickets_in_draft()
+    return render_template('index.html', product_count=product_count, custom_tickets=custom_tickets)
+
+
+@app.route('/api/products')
+@app.route(BASE_URL + '/api/products')
+def api_products():
+    """
+    Search and page through the catalog.
+    Query parameters: q (prefix match on quick/rubi code, word prefixes in the name),
+    offset, limit (max API_MAX_PAGE_SIZE), and ids_only=1 to get every matching id.
+    """
+    query = request.args.get('q', '').strip()
+
+    if request.args.get('ids_only') == '1':
+        ids = catalog.search_ids(query)
+        return jsonify({'total': len(ids), 'ids': ids})
+
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        limit = min(API_MAX_PAGE_SIZE, max(1, int(request.args.get('limit', API_DEFAULT_PAGE_SIZE))))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'offset and limit must be integers.'}), 400
+
+    total, products = catalog.search(query, offset, limit)
+    return jsonify({
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'products': [
+            {
+                'id': product['id'],
+                'quick_code': product['quick_code'],
+                'rubi_code': product.get('rubi_code', ''),
+                'name': product['name'],
+                'rrp': product['rrp'],
+            }
+            for product in products
+        ],
+    })
+
+
+@app.route('/api/catalog/versions')
+@app.route(BASE_URL + '/api/catalog/versions')
+def api_catalog_versions():
+    """Recorded catalog versions, newest first"""
+    catalog_history.observe(catalog)
+    return jsonify({'current': catalog.version, 'versions': catalog_history.versions()})
+
+
+def catalog_changes(since, to=None):
+    """Diff between catalog version since and version to (default: the current catalog)"""
+    catalog_history.observe(catalog)
+    return catalog_history.diff(since, to or catalog.version)
+
+
+@app.route('/api/catalog/changes')
+@app.route(BASE_URL + '/api/catalog/changes')
+def api_catalog_changes():
+    """
+    Products added, removed, re-priced (rrp_changed) or otherwise changed between
+    catalog version since and version to (default: the current one).
+    """
+    since = request.args.get('since', '').strip()
+    if not since:
+        return jsonify({'success': False, 'error': 'since (a catalog version) is required.'}), 400
+    to = request.args.get('to', '').strip() or catalog.version
+    try:
+        diff = catalog_changes(since, to)
+    except UnknownVersion as e:
+        return jsonify({'success': False, 'error': f'Catalog version {e.args[0]} is not in the history.'}), 404
+    return jsonify({
+        'success': True,
+        'since': since,
+        'to': to,
+        'counts': {kind: len(diff[kind]) for kind in CHANGE_KINDS},
+        **diff,
+    })
 
 
 @app.route('/add_custom', methods=['POST'])
 @app.route(BASE_URL + '/add_custom', methods=['POST'])
 def add_custom_ticket():
-    """Add a custom ticket temporarily (not saved to database) - AJAX version"""
-    custom_tickets = session.get('custom_tickets', [])
-    
+    """Add a custom ticket to the session's draft (not saved to the catalog) - AJAX version"""
     # Get data from JSON request or form data
     if request.is_json:
         data = request.get_json()
         quick_code = data.get('quick_code', '').strip()
         name = data.get('name', '').strip()
         rrp_raw = data.get('rrp', '').strip()
+        quantity_raw = str(data.get('quantity', ''))
     else:
         # Fallback for form submission
         quick_code = request.form.get('quick_code', '').strip()
         name = request.form.get('name', '').strip()
         rrp_raw = request.form.get('rrp', '').strip()
-
-    # Helper to parse currency-like input (accepts '£', '$', commas, spaces)
-    def parse_rrp(value: str):
-        if not value:
-            raise ValueError('RRP is required')
-        # Remove common currency symbols and separators
-        cleaned = value.replace('£', '').replace('$', '').replace(',', '').strip()
-        if cleaned == '':
-            raise ValueError('RRP is required')
-        return float(cleaned)
+        quantity_raw = request.form.get('quantity', '')
 
     # Validate fields
     if not quick_code:
@@ -127,20 +367,18 @@ def add_custom_ticket():
         flash(error_msg, 'error')
         return redirect(url_for('index'))
 
-    # Generate unique ID based on timestamp to avoid duplicates
-    import time
-    new_ticket = {
-        'id': f"custom_{int(time.time() * 1000)}",  # Use timestamp in milliseconds for uniqueness
-        'quick_code': quick_code,
-        'name': name,
-        'rrp': rrp,
-        'is_custom': True
-    }
+    try:
+        quantity = parse_quantity(quantity_raw)
+    except ValueError as e:
+        error_msg = f'Invalid quantity: {str(e)}'
+        if request.is_json:
+            return jsonify({'success': False, 'error': error_msg}), 400
+        flash(error_msg, 'error')
+        return redirect(url_for('index'))
+
+    new_ticket = new_custom_ticket(quick_code, name, rrp, quantity=quantity)
+    drafts.add(current_draft_id(create=True), new_ticket)
 
-    custom_tickets.append(new_ticket)
-    session['custom_tickets'] = custom_tickets
-    session.modified = True
-    
     if request.is_json:
         return jsonify({
             'success': True, 
@@ -152,12 +390,60 @@ def add_custom_ticket():
         return redirect(url_for('index'))
 
 
+@app.route('/upload_custom', methods=['POST'])
+@app.route(BASE_URL + '/upload_custom', methods=['POST'])
+def upload_custom_tickets():
+    """
+    Add many custom tickets from an uploaded CSV or XLSX file (field 'file').
+    Every row is validated like a single custom ticket; invalid rows are skipped
+    and reported. Valid rows are added to the session's draft, or with
+    generate=1 sent straight to a background generation job.
+    """
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return jsonify({'success': False, 'error': 'No file uploaded.'}), 400
+
+    try:
+        rows, errors, skipped = read_custom_tickets(upload.stream, upload.filename, CUSTOM_UPLOAD_MAX_ROWS)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    tickets = [new_custom_ticket(row['quick_code'], row['name'], row['rrp'], row.get('rubi_code'), row['quantity'])
+               for row in rows]
+    logger.info("Custom ticket upload %s: %d valid rows, %d skipped", upload.filename, len(tickets), skipped)
+    summary = {'added': len(tickets), 'skipped': skipped, 'errors': errors}
+
+    if not tickets:
+        return jsonify({'success': False, 'error': 'No valid rows in the file.', **summary}), 400
+
+    if request.form.get('generate') == '1':
+        try:
+            job = generation_jobs.submit(tickets)
+        except JobQueueFull as e:
+            return jsonify({'success': False, 'error': str(e), **summary}), 503
+        return jsonify({
+            'success': True,
+            **summary,
+            'job': job.to_dict(),
+            'status_url': url_for('generation_job_status', job_id=job.id),
+            'download_url': url_for('download_generation_job', job_id=job.id),
+        }), 202
+
+    drafts.add_many(current_draft_id(create=True), tickets)
+    return jsonify({
+        'success': True,
+        'message': f'Added {len(tickets)} custom tickets' + (f', skipped {skipped} invalid rows.' if skipped else '.'),
+        **summary,
+        'tickets': tickets,
+    })
+
+
 @app.route('/remove_custom/<ticket_id>', methods=['POST'])
 @app.route('/remove_custom', methods=['POST'])
 @app.route(BASE_URL + '/remove_custom/<ticket_id>', methods=['POST'])
 @app.route(BASE_URL + '/remove_custom', methods=['POST'])
 def remove_custom_ticket(ticket_id=None):
-    """Remove a custom ticket from session - AJAX version"""
+    """Remove a custom ticket from the session's draft - AJAX version"""
     # Get ticket_id from URL parameter, JSON data, or form data
     if ticket_id is None:
         if request.is_json:
@@ -173,23 +459,15 @@ def remove_custom_ticket(ticket_id=None):
         flash(error_msg, 'error')
         return redirect(url_for('index'))
     
-    custom_tickets = session.get('custom_tickets', [])
-    original_count = len(custom_tickets)
-    
-    # Debug: Print ticket IDs for debugging
-    print(f"Attempting to remove ticket_id: {ticket_id}")
-    print(f"Current ticket IDs: {[t['id'] for t in custom_tickets]}")
-    
-    custom_tickets = [t for t in custom_tickets if t['id'] != ticket_id]
-    
-    if len(custom_tickets) == original_count:
+    draft_id = current_draft_id()
+    logger.debug("Removing custom ticket %s from draft %s", ticket_id, draft_id)
+
+    if draft_id is None or not drafts.remove(draft_id, ticket_id):
         error_msg = f'Custom ticket with ID {ticket_id} not found.'
         if request.is_json:
             return jsonify({'success': False, 'error': error_msg}), 404
         flash(error_msg, 'error')
     else:
-        session['custom_tickets'] = custom_tickets
-        session.modified = True
         success_msg = 'Custom ticket removed!'
         if request.is_json:
             return jsonify({'success': True, 'message': success_msg})
@@ -199,63 +477,322 @@ def remove_custom_ticket(ticket_id=None):
         return redirect(url_for('index'))
 
 
+@app.route('/custom_count')
+@app.route(BASE_URL + '/custom_count')
+def custom_ticket_count():
+    """Number of custom tickets in the session's draft, without loading them"""
+    return jsonify({'success': True, 'count': drafts.count(current_draft_id())})
+
+
 @app.route('/session_debug')
 @app.route(BASE_URL + '/session_debug')
 def session_debug():
     """Debug route to check session contents"""
+    custom_tickets = custom_tickets_in_draft()
     return jsonify({
         'session_contents': dict(session),
-        'custom_tickets': session.get('custom_tickets', []),
-        'custom_tickets_count': len(session.get('custom_tickets', []))
+        'draft_id': current_draft_id(),
+        'custom_tickets': custom_tickets,
+        'custom_tickets_count': len(custom_tickets)
     })
 
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_duration(response):
+    start = g.pop('request_start', None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=request.endpoint or 'unmatched',
+                                method=request.method, status=response.status_code)
+    return response
+
+
+@app.route('/metrics')
+@app.route(BASE_URL + '/metrics')
+def metrics():
+    """Prometheus text exposition of request, stage and cache metrics"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/cache_stats')
+@app.route(BASE_URL + '/cache_stats')
+def cache_stats():
+    """Hit/miss counters and size of the generated PDF cache"""
+    return jsonify(pdf_cache.stats())
+
+
 @app.route('/generate', methods=['POST'])
 @app.route(BASE_URL + '/generate', methods=['POST'])
 def generate_tickets():
     """Generate PDF tickets for selected products and custom tickets"""
-    products = load_products()
-    
-    # Force fresh session read and ensure it's persistent
     session.permanent = True
-    custom_tickets = session.get('custom_tickets', [])
+    draft_id = current_draft_id()
+    custom_tickets = drafts.tickets(draft_id)
     
     selected_ids = request.form.getlist('product_ids[]')
+    output_format = request.form.get('output_format', 'pdf')
     
     # Log generation attempt for monitoring
-    print(f"PDF Generation - Selected: {len(selected_ids)} products, Custom: {len(custom_tickets)} tickets")
-    print(f"Custom tickets in session: {custom_tickets}")
-    print(f"Selected product IDs: {selected_ids}")
+    logger.info("%s generation: %d selected products, %d custom tickets", output_format.upper(),
+                len(selected_ids), len(custom_tickets))
+
+    if output_format not in OUTPUT_BACKENDS:
+        flash(f'Unknown output format {output_format!r}.', 'error')
+        return redirect(url_for('index'))
     
     if not selected_ids and not custom_tickets:
         flash('Please select at least one product or add a custom ticket!', 'error')
         return redirect(url_for('index'))
     
-    # Filter selected products from database
-    selected_products = [p for p in products if str(p['id']) in selected_ids]
+    # Look up selected products through the catalog's id index
+    try:
+        with STAGE_SECONDS.time(stage='catalog_load'):
+            selected = selected_products(request.form)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('index'))
     
     # Combine with custom tickets
-    all_tickets = selected_products + custom_tickets
+    all_tickets = selected + custom_tickets
     
     if not all_tickets:
         flash('Please select at least one product or add a custom ticket!', 'error')
         return redirect(url_for('index'))
     
-    # Generate PDF
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    output_file = os.path.join(OUTPUT_DIR, f'price_tickets_{timestamp}.pdf')
-    
+    # Generate PDF (or label printer commands)
     try:
-        generate_price_tickets(all_tickets, output_file)
+        if output_format == 'zpl':
+            response = send_pdf(render_labels(all_tickets), download_name(extension=label_backend.extension),
+                                mimetype=label_backend.mimetype)
+        else:
+            response = send_pdf(render_tickets(all_tickets, mode='sync'))
         # Clear custom tickets after successful generation
-        session['custom_tickets'] = []
-        session.modified = True
+        if draft_id is not None:
+            drafts.clear(draft_id)
         # Don't flash success message - handled by JavaScript
-        return send_file(output_file, as_attachment=True, download_name=f'price_tickets_{timestamp}.pdf')
+        return response
     except Exception as e:
+        logger.exception("PDF generation failed")
         flash(f'Error generating PDF: {str(e)}', 'error')
         return redirect(url_for('index'))
 
 
+def render_tickets(tickets, progress=None, mode='job'):
+    """Render tickets to PDF bytes, using the PDF cache and parallel workers for large batches"""
+    total = ticket_count(tickets)
+    workers = RENDER_WORKERS if total >= PARALLEL_MIN_TICKETS else 1
+    stats = {}
+    start = time.perf_counter()
+    try:
+        pdf_data, cache_hit = render_cached(pdf_cache, tickets, catalog.version, workers=workers,
+                                            chunk_pages=RENDER_CHUNK_PAGES, progress=progress, stats=stats,
+                                            compact=PDF_COMPACT)
+    except Exception:
+        GENERATION_ERRORS.inc(mode=mode)
+        raise
+    elapsed = time.perf_counter() - start
+
+    GENERATION_SECONDS.observe(elapsed, mode=mode, cache='hit' if cache_hit else 'miss')
+    GENERATION_TICKETS.observe(total)
+    GENERATION_PAGES.observe(-(-total // TICKETS_PER_PAGE))
+    bytes_per_ticket = len(pdf_data) / total if total else 0.0
+    GENERATION_BYTES_PER_TICKET.observe(bytes_per_ticket)
+    if not cache_hit:
+        STAGE_SECONDS.observe(stats['layout_seconds'], stage='layout')
+        STAGE_SECONDS.observe(stats['render_seconds'], stage='render')
+    logger.info("Generated %d tickets (%d pages, %d bytes, %.0f bytes/ticket) in %.3fs, cache %s", total,
+                -(-total // TICKETS_PER_PAGE), len(pdf_data), bytes_per_ticket, elapsed,
+                'hit' if cache_hit else 'miss')
+    return pdf_data
+
+
+def render_labels(tickets):
+    """Render tickets as ZPL label printer commands"""
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    stats = label_backend.render(tickets, buffer)
+    logger.info("Generated %d tickets (%d labels, %d bytes, %.0f bytes/ticket) as ZPL in %.3fs",
+                stats['tickets'], stats['labels'], stats['bytes'], stats['bytes_per_ticket'],
+                time.perf_counter() - start)
+    return buffer.getvalue()
+
+
+# Background generation jobs for selections too large to render within a request
+generation_jobs = JobManager(render_tickets, TICKETS_PER_PAGE,
+                             max_workers=JOB_WORKERS, max_pending=JOB_MAX_PENDING,
+                             result_ttl=JOB_RESULT_TTL_SECONDS, state_dir=JOB_STATE_DIR,
+                             max_result_bytes=JOB_MAX_RESULT_BYTES)
+
+
+@app.route('/jobs', methods=['POST'])
+@app.route(BASE_URL + '/jobs', methods=['POST'])
+def submit_generation_job():
+    """Start generating tickets in the background and return a job id to poll"""
+    session.permanent = True
+    draft_id = current_draft_id()
+    custom_tickets = drafts.tickets(draft_id)
+
+    try:
+        with STAGE_SECONDS.time(stage='catalog_load'):
+            all_tickets = selected_products(request.form) + custom_tickets
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    if not all_tickets:
+        return jsonify({'success': False, 'error': 'Please select at least one product or add a custom ticket!'}), 400
+
+    # Like a synchronous generation, the custom tickets leave the draft only once
+    # they have been rendered; tickets added while the job runs are kept
+    on_done = None
+    if draft_id is not None and custom_tickets:
+        on_done = functools.partial(drafts.remove_many, draft_id, [ticket['id'] for ticket in custom_tickets])
+    try:
+        job = generation_jobs.submit(all_tickets, on_done=on_done)
+    except JobQueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+
+    return jsonify({
+        'success': True,
+        'job': job.to_dict(),
+        'status_url': url_for('generation_job_status', job_id=job.id),
+        'download_url': url_for('download_generation_job', job_id=job.id),
+    }), 202
+
+
+@app.route('/generate_changes', methods=['POST'])
+@app.route(BASE_URL + '/generate_changes', methods=['POST'])
+def generate_changed_tickets():
+    """
+    Print tickets only for the products that changed since catalog version
+    since: added, re-priced and otherwise changed by default, or the kinds[]
+    given. With background=1 a generation job is started instead.
+    """
+    since = request.values.get('since', '').strip()
+    if not since:
+        return jsonify({'success': False, 'error': 'since (a catalog version) is required.'}), 400
+    kinds = request.values.getlist('kinds[]') or list(PRINTABLE_CHANGES)
+    unknown = [kind for kind in kinds if kind not in PRINTABLE_CHANGES]
+    if unknown:
+        return jsonify({'success': False, 'error': f'Unknown change kinds: {", ".join(unknown)}'}), 400
+
+    try:
+        with STAGE_SECONDS.time(stage='catalog_load'):
+            diff = catalog_changes(since)
+            tickets = catalog.get_many(changed_product_ids(diff, kinds))
+    except UnknownVersion as e:
+        return jsonify({'success': False, 'error': f'Catalog version {e.args[0]} is not in the history.'}), 404
+    logger.info("Changed tickets since %s: %s", since, {kind: len(diff[kind]) for kind in CHANGE_KINDS})
+    if not tickets:
+        return jsonify({'success': False, 'error': f'No products changed since catalog version {since}.'}), 404
+
+    if request.values.get('background') == '1':
+        try:
+            job = generation_jobs.submit(tickets)
+        except JobQueueFull as e:
+            return jsonify({'success': False, 'error': str(e)}), 503
+        return jsonify({
+            'success': True,
+            'job': job.to_dict(),
+            'status_url': url_for('generation_job_status', job_id=job.id),
+            'download_url': url_for('download_generation_job', job_id=job.id),
+        }), 202
+
+    try:
+        pdf_data = render_tickets(tickets, mode='sync')
+    except Exception as e:
+        logger.exception("PDF generation failed")
+        return jsonify({'success': False, 'error': f'Error generating PDF: {str(e)}'}), 500
+    return send_pdf(pdf_data, download_name(prefix=f'price_changes_since_{since}'))
+
+
+@app.route('/jobs/<job_id>')
+@app.route(BASE_URL + '/jobs/<job_id>')
+def generation_job_status(job_id):
+    """Progress of a background generation job"""
+    job = generation_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Job {job_id} not found.'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@app.route('/jobs/<job_id>/download')
+@app.route(BASE_URL + '/jobs/<job_id>/download')
+def download_generation_job(job_id):
+    """Download the PDF of a finished background generation job"""
+    job = generation_jobs.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': f'Job {job_id} not found.'}), 404
+    if job.status != 'done':
+        return jsonify({'success': False, 'job': job.to_dict(), 'error': f'Job is {job.status}.'}), 409
+    pdf_data = generation_jobs.result(job_id)
+    if pdf_data is None:
+        return jsonify({'success': False, 'error': f'The result of job {job_id} has expired.'}), 404
+    return send_pdf(pdf_data)
+
+
+def send_pdf(pdf_data, filename=None, mimetype='application/pdf'):
+    """Send a generated PDF (or other ticket output) using the configured OUTPUT_MODE"""
+    filename = filename or download_name()
+    response = _pdf_response(pdf_data, filename, mimetype)
+
+    # Time from building the response until the server has finished sending it.
+    # Wrap the body iterable rather than using call_on_close, which is skipped for
+    # send_file's direct-passthrough responses.
+    start = time.perf_counter()
+    response.response = ClosingIterator(
+        response.response, lambda: STAGE_SECONDS.observe(time.perf_counter() - start, stage='send'))
+    return response
+
+
+def _pdf_response(pdf_data, filename, mimetype='application/pdf'):
+
+    if OUTPUT_MODE == 'disk':
+        output_file = write_output_file(pdf_data, OUTPUT_DIR, extension=os.path.splitext(filename)[1].lstrip('.'))
+        sweep_output_dir(OUTPUT_DIR, OUTPUT_MAX_AGE_SECONDS, OUTPUT_MAX_BYTES, keep=[output_file])
+        return send_file(output_file, mimetype=mimetype, as_attachment=True, download_name=filename)
+
+    if OUTPUT_MODE == 'stream':
+        response = Response(iter_chunks(pdf_data), mimetype=mimetype)
+        response.headers['Content-Length'] = str(len(pdf_data))
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    return send_file(io.BytesIO(pdf_data), mimetype=mimetype,
+                     as_attachment=True, download_name=filename)
+
+
+def preload():
+    """
+    Load everything workers would otherwise each build on their first request:
+    the catalog and its search index, font metrics, the logo and the layouts of
+    catalog product names. A preforking server calls this once in the master so
+    the forked workers share the warm state copy-on-write (see gunicorn.conf.py).
+    """
+    start = time.perf_counter()
+    catalog.refresh()
+    # The reload listener records new versions in a thread; wait for it (and
+    # record here if it didn't), so no thread is still writing when the server forks
+    wait_for_catalog_history()
+    catalog_history.observe(catalog)
+    if CATALOG_BACKEND == 'json':
+        catalog.snapshot().search_index
+
+    grid = ticket_grid()
+    font_metrics(TICKET_FONT_NAME, TICKET_FONT_SIZE)
+    logo_image()
+    products = catalog.products() if CATALOG_BACKEND == 'json' else []
+    for product in products[:LAYOUT_CACHE_SIZE]:
+        layout_ticket_name(product['name'], grid['ticket_width'], grid['ticket_height'])
+
+    # One throwaway render imports and initialises the rest of ReportLab
+    sample = products[:1] or [{'id': 'preload', 'quick_code': '0', 'name': 'Preload', 'rrp': 0}]
+    generate_price_tickets(sample, io.BytesIO(), compact=PDF_COMPACT)
+    logger.info("Preloaded catalog version %s (%d products) in %.2fs", catalog.version, catalog.count(),
+                time.perf_counter() - start)
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5002)
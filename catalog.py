@@ -0,0 +1,287 @@
+import bisect
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def parse_rrp(value):
+    """Parse a currency-like price (accepts '£', '$', commas, spaces) into a float"""
+    if value is None:
+        raise ValueError('RRP is required')
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not value:
+        raise ValueError('RRP is required')
+    # Remove common currency symbols and separators
+    cleaned = value.replace('£', '').replace('$', '').replace(',', '').strip()
+    if cleaned == '':
+        raise ValueError('RRP is required')
+    return float(cleaned)
+
+
+# Upper bound on copies of one ticket, so a typo can't queue a million tickets
+MAX_TICKET_QUANTITY = 1000
+
+
+def parse_quantity(value):
+    """Parse the number of copies to print of a ticket; blank means 1"""
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return 1
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    try:
+        quantity = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f'quantity must be a whole number, not {value!r}')
+    if not 1 <= quantity <= MAX_TICKET_QUANTITY:
+        raise ValueError(f'quantity must be between 1 and {MAX_TICKET_QUANTITY}')
+    return quantity
+
+
+def tokenize(text):
+    """Lower-case alphanumeric tokens of text, used for name search"""
+    return re.findall(r'[a-z0-9]+', str(text).lower())
+
+
+class SearchIndex:
+    """
+    Search index over a snapshot's products.
+
+    quick_code and rubi_code support prefix matching through sorted key lists,
+    and product names are split into tokens that support prefix matching the
+    same way. Matches are sets of positions in the snapshot's product list.
+    """
+
+    def __init__(self, products):
+        quick_codes = []
+        rubi_codes = []
+        postings = {}
+        for position, product in enumerate(products):
+            quick_codes.append((str(product['quick_code']).lower(), position))
+            if product.get('rubi_code'):
+                rubi_codes.append((str(product['rubi_code']).lower(), position))
+            for token in set(tokenize(product['name'])):
+                postings.setdefault(token, []).append(position)
+        quick_codes.sort()
+        rubi_codes.sort()
+        self._quick_codes = quick_codes
+        self._rubi_codes = rubi_codes
+        self._tokens = sorted(postings)
+        self._postings = postings
+
+    @staticmethod
+    def _prefix_range(sorted_keys, prefix):
+        """Slice bounds of the entries in sorted_keys starting with prefix"""
+        start = bisect.bisect_left(sorted_keys, (prefix,))
+        end = bisect.bisect_left(sorted_keys, (prefix + '\uffff',))
+        return start, end
+
+    def _term_matches(self, term):
+        matches = set()
+        for codes in (self._quick_codes, self._rubi_codes):
+            start, end = self._prefix_range(codes, term)
+            matches.update(position for _, position in codes[start:end])
+        start = bisect.bisect_left(self._tokens, term)
+        end = bisect.bisect_left(self._tokens, term + '\uffff')
+        for token in self._tokens[start:end]:
+            matches.update(self._postings[token])
+        return matches
+
+    def search(self, query):
+        """
+        Positions of the products matching every term of query, in catalog order.
+        A term matches a quick_code or rubi_code prefix, or a prefix of a word in
+        the name. Returns None for an empty query (meaning: everything).
+        """
+        terms = tokenize(query)
+        if not terms:
+            return None
+        # Match the most selective term first so later intersections stay small
+        matches = None
+        for term in sorted(terms, key=len, reverse=True):
+            term_matches = self._term_matches(term)
+            matches = term_matches if matches is None else matches & term_matches
+            if not matches:
+                return []
+        return sorted(matches)
+
+
+class CatalogSnapshot:
+    """
+    Immutable view of one parsed version of the products file.
+    Products are kept sorted by quick_code and indexed by id, quick_code
+    and rubi_code so lookups never need to scan the full list.
+    """
+
+    def __init__(self, products, version=None):
+        # Sort products by quick_code in ascending order (smallest to largest)
+        self.products = sorted(products, key=lambda x: int(x['quick_code']))
+        self.version = version
+        self.by_id = {}
+        self.by_quick_code = {}
+        self.by_rubi_code = {}
+        self.position = {}
+        self._search_index = None
+        for index, product in enumerate(self.products):
+            product_id = str(product['id'])
+            self.by_id[product_id] = product
+            self.position[product_id] = index
+            self.by_quick_code[str(product['quick_code'])] = product
+            if product.get('rubi_code'):
+                self.by_rubi_code[str(product['rubi_code'])] = product
+
+    def __len__(self):
+        return len(self.products)
+
+    def count(self):
+        return len(self.products)
+
+    @property
+    def search_index(self):
+        """Search index for this snapshot, built on first use"""
+        if self._search_index is None:
+            self._search_index = SearchIndex(self.products)
+        return self._search_index
+
+    def search(self, query='', offset=0, limit=None):
+        """
+        Return (total, products) for the products matching query, in catalog order,
+        sliced to offset/limit for pagination.
+        """
+        positions = self.search_index.search(query)
+        if positions is None:
+            total = len(self.products)
+            end = total if limit is None else offset + limit
+            return total, self.products[offset:end]
+        end = len(positions) if limit is None else offset + limit
+        return len(positions), [self.products[position] for position in positions[offset:end]]
+
+    def search_ids(self, query=''):
+        """Ids (as strings) of every product matching query, in catalog order"""
+        positions = self.search_index.search(query)
+        if positions is None:
+            return [str(product['id']) for product in self.products]
+        return [str(self.products[position]['id']) for position in positions]
+
+    def get_many(self, product_ids):
+        """Return the products for the given ids in catalog (quick_code) order"""
+        wanted = {str(product_id) for product_id in product_ids}
+        found = [product_id for product_id in wanted if product_id in self.by_id]
+        found.sort(key=self.position.__getitem__)
+        return [self.by_id[product_id] for product_id in found]
+
+
+class ProductCatalog:
+    """
+    Product catalog backed by a JSON file, loaded once and kept in memory.
+
+    Every access does a cheap stat() of the file. The file is only re-read when
+    its mtime or size changes, and only re-parsed when its content hash changes.
+    A reload builds a complete new snapshot before swapping it in, so readers
+    always see either the old or the new catalog, never a partial one.
+
+    With auto_refresh set to False, accesses skip the stat() and serve the
+    current snapshot until refresh() is called explicitly; a preforking server
+    turns it off in the master so only the master ever reloads the file.
+    """
+
+    def __init__(self, path, auto_refresh=True):
+        self.path = path
+        self.auto_refresh = auto_refresh
+        self._lock = threading.Lock()
+        self._snapshot = CatalogSnapshot([])
+        self._stat_key = None
+        self._reload_listeners = []
+
+    def add_reload_listener(self, callback):
+        """Call callback(snapshot) after every reload that swaps in a new catalog version"""
+        self._reload_listeners.append(callback)
+
+    def snapshot(self):
+        """Return the current snapshot, reloading first if the file changed (with auto_refresh)"""
+        if self.auto_refresh:
+            self.refresh()
+        return self._snapshot
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    def count(self):
+        return len(self.snapshot())
+
+    def products(self):
+        return self.snapshot().products
+
+    def get(self, product_id):
+        return self.snapshot().by_id.get(str(product_id))
+
+    def get_by_quick_code(self, quick_code):
+        return self.snapshot().by_quick_code.get(str(quick_code))
+
+    def get_by_rubi_code(self, rubi_code):
+        return self.snapshot().by_rubi_code.get(str(rubi_code))
+
+    def get_many(self, product_ids):
+        return self.snapshot().get_many(product_ids)
+
+    def search(self, query='', offset=0, limit=None):
+        return self.snapshot().search(query, offset, limit)
+
+    def search_ids(self, query=''):
+        return self.snapshot().search_ids(query)
+
+    def refresh(self):
+        """Reload the catalog if the backing file has changed. Returns True on reload."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self._stat_key is not None:
+                with self._lock:
+                    self._snapshot = CatalogSnapshot([])
+                    self._stat_key = None
+                return True
+            return False
+
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return False
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if stat_key == self._stat_key:
+                return False
+
+            with open(self.path, 'rb') as f:
+                data = f.read()
+            version = hashlib.sha256(data).hexdigest()[:16]
+
+            reloaded = False
+            if version != self._snapshot.version:
+                try:
+                    snapshot = CatalogSnapshot(json.loads(data), version)
+                except ValueError as e:
+                    # Bad or half-written data: keep serving the previous
+                    # catalog. The stat key is recorded so the file is not
+                    # re-read on every access, only once it changes again.
+                    if self._snapshot.version is None:
+                        raise
+                    logger.warning("Ignoring invalid catalog %s (version %s), still serving version %s: %s",
+                                   self.path, version, self._snapshot.version, e)
+                    self._stat_key = stat_key
+                    return False
+                self._snapshot = snapshot
+                reloaded = True
+
+            self._stat_key = stat_key
+
+        # Outside the lock, so listeners can read the catalog
+        if reloaded:
+            for callback in self._reload_listeners:
+                callback(snapshot)
+        return reloaded
@@ -0,0 +1,162 @@
+"""
+History of catalog versions and diffs between them.
+
+Every catalog version the app sees is recorded with a fingerprint per
+product: a hash of what is printed on its ticket, plus its RRP. Comparing two
+recorded versions yields the products that were added, removed, re-priced or
+otherwise changed, so only the affected tickets need reprinting.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_versions (
+    version TEXT PRIMARY KEY,
+    recorded REAL NOT NULL,
+    products INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS catalog_version_products (
+    version TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    rrp REAL NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (version, product_id)
+) WITHOUT ROWID;
+"""
+
+DEFAULT_MAX_VERSIONS = 30
+
+# Kinds of change, in the order they are reported
+CHANGE_KINDS = ('added', 'removed', 'rrp_changed', 'changed')
+
+# Changes that need a new ticket printed (removed products have nothing to print)
+PRINTABLE_CHANGES = ('added', 'rrp_changed', 'changed')
+
+
+class UnknownVersion(KeyError):
+    """Raised when a diff names a catalog version that was never recorded"""
+
+
+def product_fingerprint(product):
+    """Hash of everything printed on a product's ticket"""
+    printed = [
+        str(product.get('quick_code', '')),
+        str(product.get('rubi_code', '')),
+        product['name'],
+        f"{float(product['rrp']):.2f}",
+    ]
+    return hashlib.sha256(json.dumps(printed).encode('utf-8')).hexdigest()[:16]
+
+
+class CatalogHistory:
+    """SQLite record of catalog versions, keeping the newest max_versions"""
+
+    def __init__(self, path, max_versions=DEFAULT_MAX_VERSIONS):
+        self.path = path
+        self.max_versions = max_versions
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _conn(self):
+        # sqlite3 connections are not shared between threads, nor with processes
+        # forked after the connection was opened (preforking servers)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            self._local.pid = os.getpid()
+        return conn
+
+    def has_version(self, version):
+        return self._conn().execute(
+            'SELECT 1 FROM catalog_versions WHERE version = ?', (version,)).fetchone() is not None
+
+    def record(self, version, products):
+        """Record products as catalog version unless it is already known. Returns True if recorded."""
+        if version is None:
+            return False
+        with self._lock:
+            if self.has_version(version):
+                return False
+            rows = [(version, str(product['id']), float(product['rrp']), product_fingerprint(product))
+                    for product in products]
+            with self._conn() as conn:
+                # Another process (server worker, batch run) may have recorded it meanwhile
+                inserted = conn.execute(
+                    'INSERT OR IGNORE INTO catalog_versions (version, recorded, products) VALUES (?, ?, ?)',
+                    (version, time.time(), len(rows))).rowcount
+                if not inserted:
+                    return False
+                conn.executemany('INSERT OR REPLACE INTO catalog_version_products VALUES (?, ?, ?, ?)', rows)
+            self.prune()
+        return True
+
+    def observe(self, catalog):
+        """Record the catalog's current version if it is new"""
+        version = catalog.version
+        if version is None or self.has_version(version):
+            return False
+        return self.record(version, catalog.products())
+
+    def versions(self):
+        """Recorded versions, newest first, as dicts with version, recorded (epoch seconds) and products"""
+        rows = self._conn().execute(
+            'SELECT version, recorded, products FROM catalog_versions ORDER BY recorded DESC').fetchall()
+        return [{'version': version, 'recorded': recorded, 'products': count} for version, recorded, count in rows]
+
+    def prune(self):
+        """Forget all but the newest max_versions versions"""
+        with self._conn() as conn:
+            stale = [row[0] for row in conn.execute(
+                'SELECT version FROM catalog_versions ORDER BY recorded DESC LIMIT -1 OFFSET ?',
+                (self.max_versions,))]
+            for version in stale:
+                conn.execute('DELETE FROM catalog_version_products WHERE version = ?', (version,))
+                conn.execute('DELETE FROM catalog_versions WHERE version = ?', (version,))
+
+    def diff(self, old_version, new_version):
+        """
+        Compare two recorded versions. Returns a dict of product id lists under
+        'added', 'removed' and 'changed' (printed fields other than the RRP),
+        and under 'rrp_changed' dicts with id, old_rrp and new_rrp.
+        Raises UnknownVersion if either version was not recorded.
+        """
+        for version in (old_version, new_version):
+            if not self.has_version(version):
+                raise UnknownVersion(version)
+        conn = self._conn()
+        added = [row[0] for row in conn.execute(
+            'SELECT n.product_id FROM catalog_version_products n '
+            'LEFT JOIN catalog_version_products o ON o.version = ? AND o.product_id = n.product_id '
+            'WHERE n.version = ? AND o.product_id IS NULL', (old_version, new_version))]
+        removed = [row[0] for row in conn.execute(
+            'SELECT o.product_id FROM catalog_version_products o '
+            'LEFT JOIN catalog_version_products n ON n.version = ? AND n.product_id = o.product_id '
+            'WHERE o.version = ? AND n.product_id IS NULL', (new_version, old_version))]
+        rrp_changed = []
+        changed = []
+        for product_id, old_rrp, new_rrp in conn.execute(
+                'SELECT n.product_id, o.rrp, n.rrp FROM catalog_version_products n '
+                'JOIN catalog_version_products o ON o.version = ? AND o.product_id = n.product_id '
+                'WHERE n.version = ? AND o.fingerprint != n.fingerprint', (old_version, new_version)):
+            if round(old_rrp, 2) != round(new_rrp, 2):
+                rrp_changed.append({'id': product_id, 'old_rrp': old_rrp, 'new_rrp': new_rrp})
+            else:
+                changed.append(product_id)
+        return {'added': added, 'removed': removed, 'rrp_changed': rrp_changed, 'changed': changed}
+
+
+def changed_product_ids(diff, kinds=PRINTABLE_CHANGES):
+    """Ids of the products in a diff whose change is one of kinds"""
+    ids = []
+    for kind in kinds:
+        ids.extend(entry['id'] if isinstance(entry, dict) else entry for entry in diff[kind])
+    return ids
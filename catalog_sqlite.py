@@ -0,0 +1,346 @@
+"""
+SQLite-backed product catalog and streaming bulk importer.
+
+SqliteProductCatalog answers the same calls as catalog.ProductCatalog, but
+every lookup is an indexed query, so the catalog never has to be loaded into
+memory as a whole. import_products() streams CSV, JSON or JSON Lines files
+into the database and upserts them in batched transactions.
+"""
+import csv
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from catalog import parse_rrp, tokenize
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    quick_code TEXT NOT NULL,
+    rubi_code TEXT,
+    name TEXT NOT NULL,
+    rrp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_products_quick_code_order ON products (CAST(quick_code AS INTEGER), quick_code);
+CREATE INDEX IF NOT EXISTS idx_products_quick_code ON products (quick_code);
+CREATE INDEX IF NOT EXISTS idx_products_rubi_code ON products (rubi_code);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_search USING fts5 (
+    quick_code, rubi_code, name,
+    content='products', content_rowid='id', prefix='1 2 3'
+);
+CREATE TABLE IF NOT EXISTS catalog_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+COLUMNS = 'id, quick_code, rubi_code, name, rrp'
+
+# Catalog order: numeric quick_code, same as the JSON catalog
+ORDER_BY = 'ORDER BY CAST(quick_code AS INTEGER), quick_code'
+
+DEFAULT_BATCH_SIZE = 2000
+
+# Accepted header names in supplier files, mapped to catalog fields
+FIELD_ALIASES = {
+    'id': 'id',
+    'product_id': 'id',
+    'quick_code': 'quick_code',
+    'quickcode': 'quick_code',
+    'qc': 'quick_code',
+    'rubi_code': 'rubi_code',
+    'rubicode': 'rubi_code',
+    'ru': 'rubi_code',
+    'name': 'name',
+    'description': 'name',
+    'product_name': 'name',
+    'rrp': 'rrp',
+    'price': 'rrp',
+}
+
+
+def _row_to_product(row):
+    product = {
+        'id': row[0],
+        'quick_code': row[1],
+        'name': row[3],
+        'rrp': row[4],
+    }
+    if row[2] is not None:
+        product['rubi_code'] = row[2]
+    return product
+
+
+def connect(db_path):
+    """Open the catalog database, creating the schema if needed"""
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(SCHEMA)
+    return conn
+
+
+class SqliteProductCatalog:
+    """Product catalog stored in SQLite, with the same interface as catalog.ProductCatalog"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        connect(db_path).close()
+
+    def _conn(self):
+        # sqlite3 connections are not shared between threads, nor with processes
+        # forked after the connection was opened (preforking servers)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = sqlite3.connect(self.db_path)
+            self._local.pid = os.getpid()
+        return conn
+
+    def _query(self, sql, params=()):
+        return self._conn().execute(sql, params).fetchall()
+
+    @property
+    def version(self):
+        rows = self._query("SELECT value FROM catalog_meta WHERE key = 'version'")
+        return rows[0][0] if rows else None
+
+    def refresh(self):
+        """Nothing to reload: every call reads the database directly"""
+        return False
+
+    def count(self):
+        return self._query('SELECT COUNT(*) FROM products')[0][0]
+
+    def products(self):
+        return [_row_to_product(row) for row in self._query(f'SELECT {COLUMNS} FROM products {ORDER_BY}')]
+
+    def get(self, product_id):
+        rows = self._query(f'SELECT {COLUMNS} FROM products WHERE id = ?', (product_id,))
+        return _row_to_product(rows[0]) if rows else None
+
+    def get_by_quick_code(self, quick_code):
+        rows = self._query(f'SELECT {COLUMNS} FROM products WHERE quick_code = ?', (str(quick_code),))
+        return _row_to_product(rows[0]) if rows else None
+
+    def get_by_rubi_code(self, rubi_code):
+        rows = self._query(f'SELECT {COLUMNS} FROM products WHERE rubi_code = ?', (str(rubi_code),))
+        return _row_to_product(rows[0]) if rows else None
+
+    def get_many(self, product_ids):
+        """Return the products for the given ids in catalog (quick_code) order"""
+        ids = []
+        for product_id in {str(product_id) for product_id in product_ids}:
+            try:
+                ids.append((int(product_id),))
+            except ValueError:
+                continue
+        # The ids go through a connection-private temp table rather than IN (...)
+        # batches, so SQLite orders the result with the same ORDER_BY as search()
+        conn = self._conn()
+        with conn:
+            conn.execute('CREATE TEMP TABLE IF NOT EXISTS wanted_ids (id INTEGER PRIMARY KEY)')
+            conn.executemany('INSERT OR IGNORE INTO wanted_ids (id) VALUES (?)', ids)
+            rows = conn.execute(
+                f'SELECT {COLUMNS} FROM products WHERE id IN (SELECT id FROM wanted_ids) {ORDER_BY}').fetchall()
+            conn.execute('DELETE FROM wanted_ids')
+        return [_row_to_product(row) for row in rows]
+
+    @staticmethod
+    def _match_expression(query):
+        """FTS5 query requiring every term as a prefix of a code or a word of the name"""
+        terms = tokenize(query)
+        if not terms:
+            return None
+        return ' AND '.join(f'"{term}"*' for term in terms)
+
+    def search(self, query='', offset=0, limit=None):
+        """Return (total, products) for the products matching query, in catalog order"""
+        match = self._match_expression(query)
+        limit_sql = 'LIMIT ? OFFSET ?'
+        page = (-1 if limit is None else limit, offset)
+        if match is None:
+            total = self.count()
+            rows = self._query(f'SELECT {COLUMNS} FROM products {ORDER_BY} {limit_sql}', page)
+        else:
+            matching = 'id IN (SELECT rowid FROM products_search WHERE products_search MATCH ?)'
+            total = self._query(f'SELECT COUNT(*) FROM products WHERE {matching}', (match,))[0][0]
+            rows = self._query(f'SELECT {COLUMNS} FROM products WHERE {matching} {ORDER_BY} {limit_sql}',
+                               (match,) + page)
+        return total, [_row_to_product(row) for row in rows]
+
+    def search_ids(self, query=''):
+        """Ids (as strings) of every product matching query, in catalog order"""
+        match = self._match_expression(query)
+        if match is None:
+            rows = self._query(f'SELECT id FROM products {ORDER_BY}')
+        else:
+            rows = self._query(
+                'SELECT id FROM products WHERE id IN '
+                f'(SELECT rowid FROM products_search WHERE products_search MATCH ?) {ORDER_BY}', (match,))
+        return [str(row[0]) for row in rows]
+
+
+def iter_csv_rows(f):
+    """Yield dicts from a CSV file object, one row at a time"""
+    reader = csv.DictReader(f)
+    for row in reader:
+        yield row
+
+
+def iter_json_rows(f, chunk_size=64 * 1024):
+    """
+    Yield objects from a JSON array file (like products.json) or a JSON Lines
+    file without loading the whole file into memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    while True:
+        chunk = f.read(chunk_size)
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not started and buffer.startswith('['):
+                buffer = buffer[1:]
+                started = True
+                continue
+            if buffer.startswith(','):
+                buffer = buffer[1:]
+                continue
+            if buffer.startswith(']') or not buffer:
+                break
+            try:
+                obj, end = decoder.raw_decode(buffer)
+            except ValueError:
+                if not chunk:
+                    raise
+                # Object continues in the next chunk
+                break
+            yield obj
+            buffer = buffer[end:]
+        if not chunk:
+            return
+
+
+def normalize_row(row):
+    """Map a supplier row onto catalog fields; raises ValueError if it cannot be imported"""
+    product = {}
+    for key, value in row.items():
+        field = FIELD_ALIASES.get(str(key).strip().lower().replace(' ', '_')) if key is not None else None
+        if field and value not in (None, ''):
+            product[field] = value.strip() if isinstance(value, str) else value
+
+    if not product.get('quick_code'):
+        raise ValueError('quick_code is required')
+    if not product.get('name'):
+        raise ValueError('name is required')
+    return (
+        int(product['id']) if product.get('id') not in (None, '') else None,
+        str(product['quick_code']),
+        str(product['rubi_code']) if product.get('rubi_code') not in (None, '') else None,
+        str(product['name']),
+        parse_rrp(product.get('rrp')),
+    )
+
+
+UPSERT_BY_ID = f"""
+INSERT INTO products ({COLUMNS}) VALUES (?, ?, ?, ?, ?)
+ON CONFLICT (id) DO UPDATE SET
+    quick_code = excluded.quick_code,
+    rubi_code = COALESCE(excluded.rubi_code, products.rubi_code),
+    name = excluded.name,
+    rrp = excluded.rrp
+"""
+
+UPDATE_BY_QUICK_CODE = """
+UPDATE products SET rubi_code = COALESCE(?, rubi_code), name = ?, rrp = ? WHERE quick_code = ?
+"""
+
+INSERT_NEW = "INSERT INTO products (quick_code, rubi_code, name, rrp) VALUES (?, ?, ?, ?)"
+
+
+def _write_batch(conn, batch):
+    """
+    Upsert one batch in a single transaction. Rows with an id upsert on id;
+    rows without one update every product with that quick_code, or insert a
+    new product if there is none.
+    """
+    with conn:
+        conn.executemany(UPSERT_BY_ID, [row for row in batch if row[0] is not None])
+        for _, quick_code, rubi_code, name, rrp in (row for row in batch if row[0] is None):
+            if conn.execute(UPDATE_BY_QUICK_CODE, (rubi_code, name, rrp, quick_code)).rowcount == 0:
+                conn.execute(INSERT_NEW, (quick_code, rubi_code, name, rrp))
+
+
+def content_version(conn):
+    """Hash of every product row, so re-importing unchanged data keeps the version"""
+    digest = hashlib.sha256()
+    for row in conn.execute(f'SELECT {COLUMNS} FROM products ORDER BY id'):
+        digest.update(repr(row).encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+def import_products(db_path, source, file_format=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Stream products from source (a path or text file object) into the catalog
+    database in transactions of batch_size rows. Rows are upserted on id when
+    the file has one, otherwise on quick_code.
+    file_format is 'csv', 'json' or 'jsonl'; by default it comes from the file
+    extension. Returns a summary dict with imported/skipped counts, the first
+    errors and the elapsed time.
+    """
+    if file_format is None:
+        name = source if isinstance(source, str) else getattr(source, 'name', '')
+        file_format = os.path.splitext(name)[1].lstrip('.').lower() or 'csv'
+    if file_format not in ('csv', 'json', 'jsonl'):
+        raise ValueError(f'Unsupported import format: {file_format}')
+
+    start = time.perf_counter()
+    if isinstance(source, str):
+        # utf-8-sig drops the BOM spreadsheet exports often start with
+        f = open(source, 'r', encoding='utf-8-sig', newline='')
+    else:
+        f = source
+    rows = iter_csv_rows(f) if file_format == 'csv' else iter_json_rows(f)
+
+    conn = connect(db_path)
+    imported = 0
+    skipped = 0
+    errors = []
+    batch = []
+    try:
+        for line_number, row in enumerate(rows, start=2 if file_format == 'csv' else 1):
+            try:
+                batch.append(normalize_row(row))
+            except (ValueError, TypeError, AttributeError) as e:
+                skipped += 1
+                if len(errors) < 100:
+                    errors.append({'row': line_number, 'error': str(e)})
+                continue
+            if len(batch) >= batch_size:
+                _write_batch(conn, batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            _write_batch(conn, batch)
+            imported += len(batch)
+        with conn:
+            # Rebuild the search index and set the version once the data is in
+            conn.execute("INSERT INTO products_search (products_search) VALUES ('rebuild')")
+            conn.execute("INSERT OR REPLACE INTO catalog_meta (key, value) VALUES ('version', ?)",
+                         (content_version(conn),))
+    finally:
+        conn.close()
+        if f is not source:
+            f.close()
+
+    return {
+        'imported': imported,
+        'skipped': skipped,
+        'errors': errors,
+        'seconds': time.perf_counter() - start,
+    }
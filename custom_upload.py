@@ -0,0 +1,131 @@
+"""
+Bulk upload of custom tickets from CSV or XLSX files.
+
+Rows are read one at a time and validated with the same rules as a single
+custom ticket; bad rows are reported with their row number and skipped, so
+one typo doesn't reject the whole file. XLSX files are read with openpyxl,
+which is only imported when a spreadsheet is uploaded.
+"""
+import io
+import os
+
+from catalog import parse_quantity, parse_rrp
+from catalog_sqlite import FIELD_ALIASES, iter_csv_rows
+
+
+UPLOAD_FORMATS = ('csv', 'xlsx')
+
+# Catalog import headers, plus the number of copies to print
+UPLOAD_FIELD_ALIASES = dict(FIELD_ALIASES, quantity='quantity', qty='quantity', copies='quantity')
+
+# Only this many row errors are returned; the rest are just counted
+MAX_REPORTED_ERRORS = 100
+
+
+def upload_format(filename):
+    """'csv' or 'xlsx' from the file extension; raises ValueError for anything else"""
+    file_format = os.path.splitext(filename or '')[1].lstrip('.').lower()
+    if file_format not in UPLOAD_FORMATS:
+        raise ValueError(f'Unsupported file type {file_format or "(none)"!r}; upload a CSV or XLSX file.')
+    return file_format
+
+
+def iter_xlsx_rows(stream):
+    """Yield dicts from the first worksheet of an XLSX file, keyed by the header row"""
+    try:
+        import openpyxl
+    except ImportError:
+        raise ValueError('XLSX uploads need openpyxl (pip install openpyxl); upload a CSV file instead.')
+
+    # read_only mode streams rows instead of building the whole sheet in memory
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        for values in rows:
+            yield dict(zip(header, values))
+    finally:
+        workbook.close()
+
+
+def iter_upload_rows(stream, filename):
+    """Yield (row_number, row_dict) from an uploaded binary file stream; row 1 is the header"""
+    if upload_format(filename) == 'xlsx':
+        rows = iter_xlsx_rows(stream)
+    else:
+        # utf-8-sig drops the BOM spreadsheet exports often start with
+        rows = iter_csv_rows(io.TextIOWrapper(stream, encoding='utf-8-sig', newline=''))
+    return enumerate(rows, start=2)
+
+
+def _cell_text(value):
+    # Spreadsheets store numeric codes as floats (12345.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def parse_custom_row(row):
+    """Turn an uploaded row into custom ticket fields; raises ValueError if it is not valid"""
+    fields = {}
+    for key, value in row.items():
+        field = UPLOAD_FIELD_ALIASES.get(str(key).strip().lower().replace(' ', '_')) if key is not None else None
+        if field and value not in (None, ''):
+            fields[field] = value
+
+    quick_code = _cell_text(fields.get('quick_code', ''))
+    if not quick_code:
+        raise ValueError('Quick code is required for a custom ticket.')
+    name = _cell_text(fields.get('name', ''))
+    if not name:
+        raise ValueError('Product name is required for a custom ticket.')
+    rrp_value = fields.get('rrp')
+    try:
+        rrp = parse_rrp(rrp_value.strip() if isinstance(rrp_value, str) else rrp_value)
+    except ValueError as e:
+        raise ValueError(f'Invalid RRP value: {e}')
+
+    try:
+        quantity = parse_quantity(fields.get('quantity'))
+    except ValueError as e:
+        raise ValueError(f'Invalid quantity: {e}')
+
+    ticket = {'quick_code': quick_code, 'name': name, 'rrp': rrp, 'quantity': quantity}
+    if fields.get('rubi_code') not in (None, ''):
+        ticket['rubi_code'] = _cell_text(fields['rubi_code'])
+    return ticket
+
+
+def read_custom_tickets(stream, filename, max_rows):
+    """
+    Validate every row of an uploaded file. Returns (tickets, errors, skipped):
+    the valid ticket field dicts in file order, up to MAX_REPORTED_ERRORS
+    {'row', 'error'} dicts, and the number of rows that were rejected.
+    Raises ValueError if the file itself cannot be read.
+    """
+    tickets = []
+    errors = []
+    skipped = 0
+    try:
+        for row_number, row in iter_upload_rows(stream, filename):
+            if all(value in (None, '') for value in row.values()):
+                continue
+            if len(tickets) + skipped >= max_rows:
+                errors.append({'row': row_number, 'error': f'Only the first {max_rows} rows of a file are read.'})
+                break
+            try:
+                tickets.append(parse_custom_row(row))
+            except (ValueError, TypeError) as e:
+                skipped += 1
+                if len(errors) < MAX_REPORTED_ERRORS:
+                    errors.append({'row': row_number, 'error': str(e)})
+    except UnicodeDecodeError:
+        raise ValueError('CSV files must be UTF-8 encoded.')
+    except ValueError:
+        raise
+    except Exception as e:
+        # openpyxl raises a variety of errors for files that aren't real spreadsheets
+        raise ValueError(f'Could not read {filename}: {e}')
+    return tickets, errors, skipped
@@ -0,0 +1,124 @@
+"""
+Server-side store for custom-ticket drafts.
+
+The session cookie only holds an opaque draft id; the tickets themselves live
+in a local SQLite database. Adding or removing a ticket touches one row, so
+the cost no longer grows with the size of the draft and there is no cookie
+size ceiling. Drafts expire ttl_seconds after their last change.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS drafts (
+    id TEXT PRIMARY KEY,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_drafts_updated ON drafts (updated);
+CREATE TABLE IF NOT EXISTS draft_tickets (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    draft_id TEXT NOT NULL,
+    ticket_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    UNIQUE (draft_id, ticket_id)
+);
+"""
+
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+
+class DraftStore:
+    """SQLite-backed custom ticket drafts with per-draft TTL expiry"""
+
+    def __init__(self, path, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        conn = sqlite3.connect(path)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.close()
+
+    def _conn(self):
+        # sqlite3 connections are not shared between threads, nor with processes
+        # forked after the connection was opened (preforking servers)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=10)
+            self._local.pid = os.getpid()
+        return conn
+
+    def _touch(self, conn, draft_id):
+        conn.execute('UPDATE drafts SET updated = ? WHERE id = ?', (time.time(), draft_id))
+
+    def create(self):
+        """Start a new empty draft and return its id"""
+        self.purge_expired()
+        draft_id = uuid.uuid4().hex
+        with self._conn() as conn:
+            conn.execute('INSERT INTO drafts (id, updated) VALUES (?, ?)', (draft_id, time.time()))
+        return draft_id
+
+    def exists(self, draft_id):
+        """True if draft_id names a draft that has not expired"""
+        if not draft_id:
+            return False
+        row = self._conn().execute('SELECT updated FROM drafts WHERE id = ?', (draft_id,)).fetchone()
+        return row is not None and row[0] > time.time() - self.ttl_seconds
+
+    def add(self, draft_id, ticket):
+        self.add_many(draft_id, [ticket])
+
+    def add_many(self, draft_id, tickets):
+        """Append tickets (dicts with a unique 'id') to a draft in one transaction"""
+        with self._conn() as conn:
+            conn.executemany(
+                'INSERT INTO draft_tickets (draft_id, ticket_id, data) VALUES (?, ?, ?)',
+                [(draft_id, str(ticket['id']), json.dumps(ticket)) for ticket in tickets])
+            self._touch(conn, draft_id)
+
+    def remove(self, draft_id, ticket_id):
+        """Remove one ticket from a draft. Returns False if it was not there."""
+        return self.remove_many(draft_id, [ticket_id]) > 0
+
+    def remove_many(self, draft_id, ticket_ids):
+        """Remove tickets from a draft in one transaction. Returns the number removed."""
+        with self._conn() as conn:
+            removed = conn.executemany('DELETE FROM draft_tickets WHERE draft_id = ? AND ticket_id = ?',
+                                       [(draft_id, str(ticket_id)) for ticket_id in ticket_ids]).rowcount
+            self._touch(conn, draft_id)
+        return removed
+
+    def tickets(self, draft_id):
+        """All tickets in a draft, in the order they were added"""
+        if not draft_id:
+            return []
+        rows = self._conn().execute(
+            'SELECT data FROM draft_tickets WHERE draft_id = ? ORDER BY seq', (draft_id,)).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count(self, draft_id):
+        """Number of tickets in a draft"""
+        if not draft_id:
+            return 0
+        return self._conn().execute(
+            'SELECT COUNT(*) FROM draft_tickets WHERE draft_id = ?', (draft_id,)).fetchone()[0]
+
+    def clear(self, draft_id):
+        """Remove every ticket from a draft, keeping the draft itself"""
+        with self._conn() as conn:
+            conn.execute('DELETE FROM draft_tickets WHERE draft_id = ?', (draft_id,))
+            self._touch(conn, draft_id)
+
+    def purge_expired(self):
+        """Delete drafts (and their tickets) not changed within the TTL. Returns the number removed."""
+        cutoff = time.time() - self.ttl_seconds
+        with self._conn() as conn:
+            conn.execute('DELETE FROM draft_tickets WHERE draft_id IN (SELECT id FROM drafts WHERE updated < ?)',
+                         (cutoff,))
+            return conn.execute('DELETE FROM drafts WHERE updated < ?', (cutoff,)).rowcount
@@ -0,0 +1,113 @@
+"""
+Gunicorn settings for serving the ticket generator in production.
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+The app is imported and preloaded (catalog, search index, fonts, logo, name
+layouts) once in the master before any worker is forked, so every worker
+starts warm and shares that memory copy-on-write. PDF generation is CPU
+bound, so throughput scales with worker processes; threads per worker only
+keep slow clients and job polling from blocking generation.
+
+When products.json changes the master reloads it, preloads again and
+gracefully recycles the workers: new workers are forked with the new catalog,
+old ones finish their in-flight requests first. `kill -HUP <master pid>`
+(systemctl reload) does the same by hand. Workers never check the file
+themselves; with CATALOG_WATCH_SECONDS=0 a reload only happens on SIGHUP.
+
+Settings (environment variables):
+    BIND                   address to listen on (default 127.0.0.1:5002)
+    WEB_WORKERS            worker processes (default: one per CPU core)
+    WEB_THREADS            threads per worker (default 4)
+    WEB_TIMEOUT            seconds before a silent worker is restarted (default 120)
+    WEB_GRACEFUL_TIMEOUT   seconds old workers get to finish when recycled (default 60)
+    WEB_MAX_REQUESTS       recycle a worker after this many requests, 0 = never (default 0)
+    CATALOG_WATCH_SECONDS  how often the master checks products.json, 0 = never (default 5)
+"""
+import gc
+import os
+import signal
+import tempfile
+import threading
+import time
+
+bind = os.environ.get('BIND', '127.0.0.1:5002')
+workers = int(os.environ.get('WEB_WORKERS', '0')) or os.cpu_count() or 1
+threads = int(os.environ.get('WEB_THREADS', '4'))
+worker_class = 'gthread'
+timeout = int(os.environ.get('WEB_TIMEOUT', '120'))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '60'))
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+CATALOG_WATCH_SECONDS = float(os.environ.get('CATALOG_WATCH_SECONDS', '5'))
+
+# Job polls, downloads and metric scrapes can reach any worker, so job state and
+# metrics must be shared
+if workers > 1:
+    os.environ.setdefault('JOB_STATE_DIR', os.path.join(tempfile.gettempdir(), 'rubi-ticket-jobs'))
+    os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'rubi-ticket-metrics'))
+
+
+def _preload(server):
+    from app import CATALOG_BACKEND, catalog, preload
+
+    preload()
+    # The master reloads the catalog (on_reload) and forks fresh workers with it,
+    # so workers must not stat and re-parse the file themselves
+    if CATALOG_BACKEND == 'json':
+        catalog.auto_refresh = False
+    # Keep the preloaded objects out of the garbage collector's generations:
+    # collections in the workers would otherwise touch (and so copy) their pages
+    gc.collect()
+    gc.freeze()
+
+
+def _catalog_stat(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _watch_catalog(server, path):
+    """Ask the master to recycle its workers whenever the catalog file changes"""
+    last = _catalog_stat(path)
+    while True:
+        time.sleep(CATALOG_WATCH_SECONDS)
+        current = _catalog_stat(path)
+        if current != last:
+            last = current
+            server.log.info("%s changed; recycling workers", path)
+            # The master reloads the catalog in on_reload, on its main thread, before forking
+            os.kill(os.getpid(), signal.SIGHUP)
+
+
+def on_starting(server):
+    # Metrics start from zero with each server run, like a single process
+    if os.environ.get('METRICS_DIR'):
+        from metrics import clear_shared_metrics
+
+        clear_shared_metrics(os.environ['METRICS_DIR'])
+
+
+def when_ready(server):
+    _preload(server)
+    from app import CATALOG_BACKEND, DATA_FILE
+
+    if CATALOG_WATCH_SECONDS > 0 and CATALOG_BACKEND == 'json':
+        threading.Thread(target=_watch_catalog, args=(server, DATA_FILE), name='catalog-watch',
+                         daemon=True).start()
+
+
+def on_reload(server):
+    _preload(server)
+
+
+def worker_exit(server, worker):
+    # Publish the last second of metrics before the worker's snapshot is archived
+    from metrics import REGISTRY
+
+    REGISTRY.flush()
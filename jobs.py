@@ -0,0 +1,245 @@
+"""
+Background ticket generation jobs.
+
+Large selections are rendered on a small, bounded thread pool instead of in
+the request thread. Clients submit a job, poll its progress (tickets and pages
+rendered) and download the PDF once it is done.
+
+When the app runs in several worker processes, the poll and the download can
+reach a different process than the one running the job. Give the JobManager a
+state_dir shared by all workers and job status and results are published
+there as files.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from pdf_generator import ticket_count
+
+
+logger = logging.getLogger(__name__)
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+# Job ids are uuid4 hex strings; anything else is never looked up on disk
+JOB_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# Minimum seconds between progress writes to the state directory
+STATE_WRITE_INTERVAL = 0.5
+
+
+class GenerationJob:
+    """State of one background generation, updated by the worker thread"""
+
+    def __init__(self, tickets, tickets_per_page):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.total_tickets = ticket_count(tickets)
+        self.total_pages = -(-self.total_tickets // tickets_per_page)
+        self.tickets_done = 0
+        self.pages_done = 0
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.finished = None
+        self.tickets = tickets
+        self.on_done = None
+
+    def update_progress(self, tickets_done, pages_done):
+        self.tickets_done = tickets_done
+        self.pages_done = pages_done
+
+    @classmethod
+    def from_dict(cls, data):
+        """Rebuild a job from to_dict() output (as published by another process)"""
+        job = cls.__new__(cls)
+        job.id = data['job_id']
+        job.status = data['status']
+        job.total_tickets = data['total_tickets']
+        job.total_pages = data['total_pages']
+        job.tickets_done = data['tickets_done']
+        job.pages_done = data['pages_done']
+        job.error = data['error']
+        job.result = None
+        job.created = data.get('created')
+        job.finished = data.get('finished')
+        job.tickets = None
+        job.on_done = None
+        return job
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'total_tickets': self.total_tickets,
+            'total_pages': self.total_pages,
+            'tickets_done': self.tickets_done,
+            'pages_done': self.pages_done,
+            'error': self.error,
+        }
+
+
+class JobManager:
+    """
+    Runs generation jobs on a bounded worker pool.
+
+    render is called as render(tickets, progress) in a worker thread and must
+    return the PDF bytes. Finished jobs are kept for result_ttl seconds so the
+    client has time to download them (see result()). Results held in memory
+    are capped at max_result_bytes in total: past that, the oldest finished
+    jobs are forgotten early.
+
+    With state_dir, every job's status is also written to <job id>.json and
+    its PDF to <job id>.pdf there, so any process sharing the directory can
+    report on and serve it. The PDF is then only kept on disk. max_pending
+    still applies per process.
+    """
+
+    def __init__(self, render, tickets_per_page, max_workers=2, max_pending=20, result_ttl=3600,
+                 state_dir=None, max_result_bytes=512 * 1024 * 1024):
+        self.render = render
+        self.tickets_per_page = tickets_per_page
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.max_result_bytes = max_result_bytes
+        self.state_dir = state_dir
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ticket-job')
+        self._jobs = {}
+        self._lock = threading.Lock()
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+    def submit(self, tickets, on_done=None):
+        """
+        Queue a new job for tickets and return it immediately. on_done is
+        called in the worker thread once the job has rendered successfully.
+        """
+        job = GenerationJob(tickets, self.tickets_per_page)
+        job.on_done = on_done
+        with self._lock:
+            self._prune()
+            pending = sum(1 for existing in self._jobs.values() if existing.status in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise JobQueueFull(f'{pending} generation jobs are already pending, please try again shortly')
+            self._jobs[job.id] = job
+        self._publish(job)
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        """The job with job_id, from this process or the shared state directory, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.state_dir and JOB_ID_PATTERN.match(job_id):
+            job = self._load(job_id)
+        return job
+
+    def result(self, job_id):
+        """The PDF bytes of a finished job, from memory or the shared state directory, or None"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None and job.result is not None:
+            return job.result
+        if not self.state_dir or not JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(os.path.join(self.state_dir, job_id + '.pdf'), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _run(self, job):
+        job.status = 'running'
+        self._publish(job)
+        last_write = time.monotonic()
+
+        def progress(tickets_done, pages_done):
+            nonlocal last_write
+            job.update_progress(tickets_done, pages_done)
+            if self.state_dir and time.monotonic() - last_write >= STATE_WRITE_INTERVAL:
+                self._publish(job)
+                last_write = time.monotonic()
+
+        try:
+            result = self.render(job.tickets, progress)
+            job.update_progress(job.total_tickets, job.total_pages)
+            if self.state_dir:
+                # Served from the file from now on; don't hold a second copy in memory
+                self._write(job.id + '.pdf', result)
+            else:
+                job.result = result
+            job.status = 'done'
+        except Exception as e:
+            logger.exception("Generation job %s failed", job.id)
+            job.error = str(e)
+            job.status = 'failed'
+        finally:
+            # The ticket list is no longer needed once rendered
+            job.tickets = None
+            on_done, job.on_done = job.on_done, None
+            if on_done is not None and job.status == 'done':
+                try:
+                    on_done()
+                except Exception:
+                    logger.exception("Completion callback of generation job %s failed", job.id)
+            job.finished = time.time()
+            self._publish(job)
+            with self._lock:
+                self._prune()
+
+    def _write(self, name, data):
+        path = os.path.join(self.state_dir, name)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _publish(self, job):
+        """Write the job's status to the state directory, if there is one"""
+        if self.state_dir:
+            state = dict(job.to_dict(), created=job.created, finished=job.finished)
+            self._write(job.id + '.json', json.dumps(state).encode('utf-8'))
+
+    def _load(self, job_id):
+        """Read the status of a job published by another process (its PDF is read by result())"""
+        try:
+            with open(os.path.join(self.state_dir, job_id + '.json'), 'rb') as f:
+                job = GenerationJob.from_dict(json.loads(f.read()))
+        except (FileNotFoundError, ValueError):
+            return None
+        if job.finished and job.finished < time.time() - self.result_ttl:
+            return None
+        return job
+
+    def _prune(self):
+        """
+        Forget finished jobs whose results have expired, then the oldest ones
+        while the results held in memory exceed max_result_bytes (caller holds
+        the lock)
+        """
+        cutoff = time.time() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        held = [job for job in self._jobs.values() if job.result is not None]
+        held_bytes = sum(len(job.result) for job in held)
+        for job in sorted(held, key=lambda job: job.finished):
+            if held_bytes <= self.max_result_bytes:
+                break
+            held_bytes -= len(job.result)
+            del self._jobs[job.id]
+        if self.state_dir:
+            # Also catches files left behind by processes that have since exited
+            for entry in os.scandir(self.state_dir):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
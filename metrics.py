@@ -0,0 +1,396 @@
+"""
+Minimal in-process metrics with Prometheus text exposition.
+
+Histograms and counters are registered on a Registry and rendered by the
+app's /metrics route. Everything is thread-safe and has no dependencies.
+
+A preforking server runs several worker processes, each with its own
+metrics, and a scrape reaches only one of them. Registry.share(directory)
+makes every process write a snapshot of its metrics to <pid>-<token>.json
+in a directory they all share, and /metrics in any process renders the sum of
+all snapshots. Snapshots of processes that have exited are folded into
+archive.json, so counters and histograms keep counting across worker
+restarts; gauges only sum the live processes.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+# Latency buckets in seconds, from a cache hit up to a very large run
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Buckets for ticket and page counts per generation
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+# Buckets for PDF bytes per ticket (large single tickets down to long compact runs)
+BYTES_PER_TICKET_BUCKETS = (50, 75, 100, 150, 250, 500, 1000, 2500, 5000, 10000)
+
+# Maximum seconds a process's shared snapshot lags behind its own metrics
+SHARED_WRITE_INTERVAL = 1.0
+
+# Snapshot file of processes that have exited, in a shared metrics directory
+ARCHIVE_NAME = 'archive.json'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in labels)
+    return '{' + pairs + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Counter:
+    """Monotonically increasing value, optionally split by labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help_text, labelnames=(), on_change=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.on_change = on_change
+        self.reset()
+
+    def reset(self):
+        """Forget every value (and any lock held by another thread before a fork)"""
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        if self.on_change:
+            self.on_change()
+
+    def snapshot(self):
+        """Copy of the current values by label key"""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total, values):
+        """Add the values of one snapshot to total"""
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self, values=None):
+        values = sorted((self.snapshot() if values is None else values).items())
+        return [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in values]
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets, optionally split by labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS, on_change=None):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.on_change = on_change
+        self.reset()
+
+    def reset(self):
+        """Forget every observation (and any lock held by another thread before a fork)"""
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple((name, labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['counts'][i] += 1
+                    break
+            series['sum'] += value
+            series['count'] += 1
+        if self.on_change:
+            self.on_change()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the with-block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """Copy of the current series (bucket counts, sum and count) by label key"""
+        with self._lock:
+            return {key: dict(data, counts=list(data['counts'])) for key, data in self._series.items()}
+
+    @staticmethod
+    def merge(total, series):
+        """Add the series of one snapshot to total"""
+        for key, data in series.items():
+            existing = total.get(key)
+            if existing is None:
+                total[key] = dict(data, counts=list(data['counts']))
+            else:
+                existing['counts'] = [a + b for a, b in zip(existing['counts'], data['counts'])]
+                existing['sum'] += data['sum']
+                existing['count'] += data['count']
+
+    def render(self, series=None):
+        series = sorted((self.snapshot() if series is None else series).items())
+        lines = []
+        for key, data in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, data['counts']):
+                cumulative += count
+                labels = _format_labels(key + (('le', _format_value(float(bound))),))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(data["sum"])}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {data["count"]}')
+        return lines
+
+
+def _encode(values):
+    """Label-keyed values as JSON-friendly [[label pairs], value] lists"""
+    return [[[list(pair) for pair in key], value] for key, value in values.items()]
+
+
+def _decode(items):
+    return {tuple(tuple(pair) for pair in key): value for key, value in items}
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self.shared_dir = None
+        self._dirty = False
+        self._flusher_pid = None
+        self._token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def counter(self, name, help_text, labelnames=()):
+        metric = Counter(name, help_text, labelnames, on_change=self._changed)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, labelnames, buckets, on_change=self._changed)
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(self, name, help_text, callback, kind='gauge'):
+        """Register a metric whose current value is read from callback() at render time"""
+        self._collectors.append((name, help_text, callback, kind))
+
+    def share(self, directory):
+        """
+        Aggregate metrics across processes through directory. Call this before
+        forking: forked children start with empty metrics of their own.
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.shared_dir = directory
+        # Never fork while holding the directory lock: the child would inherit the
+        # locked file and keep it locked for as long as it lives
+        os.register_at_fork(before=lambda: self._file_lock.acquire(),
+                            after_in_parent=lambda: self._file_lock.release(),
+                            after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        for metric in self._metrics:
+            metric.reset()
+        self._dirty = False
+        self._flusher_pid = None
+        self._token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._file_lock = threading.Lock()
+
+    def _changed(self):
+        self._dirty = True
+        if self.shared_dir and self._flusher_pid != os.getpid():
+            with self._lock:
+                if self._flusher_pid != os.getpid():
+                    self._flusher_pid = os.getpid()
+                    threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(SHARED_WRITE_INTERVAL)
+            if self._dirty:
+                self.flush()
+
+    def snapshot(self):
+        """This process's metric values by name, callbacks included"""
+        values = {metric.name: metric.snapshot() for metric in self._metrics}
+        for name, _, callback, _ in self._collectors:
+            values[name] = float(callback())
+        return values
+
+    def _encode_snapshot(self, values):
+        return {name: value if isinstance(value, float) else _encode(value) for name, value in values.items()}
+
+    def _decode_snapshot(self, data):
+        return {name: value if isinstance(value, (int, float)) else _decode(value) for name, value in data.items()}
+
+    def _merge(self, total, values, live=True):
+        """Add a snapshot to total; gauges only count for live processes"""
+        for metric in self._metrics:
+            if metric.name in values:
+                metric.merge(total.setdefault(metric.name, {}), values[metric.name])
+        for name, _, _, kind in self._collectors:
+            if name in values and (live or kind == 'counter'):
+                total[name] = total.get(name, 0.0) + values[name]
+
+    def _write_json(self, name, data):
+        path = os.path.join(self.shared_dir, name)
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(temp_path, path)
+
+    def _read_json(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @contextmanager
+    def _directory_lock(self, exclusive):
+        # The thread lock also serialises this process's snapshot writes
+        with self._file_lock, open(os.path.join(self.shared_dir, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def flush(self):
+        """Write this process's snapshot to the shared directory"""
+        if not self.shared_dir:
+            return
+        self._dirty = False
+        with self._directory_lock(exclusive=False):
+            data = {'pid': os.getpid(), 'metrics': self._encode_snapshot(self.snapshot())}
+            self._write_json(f'{os.getpid()}-{self._token}.json', data)
+
+    def _snapshot_files(self):
+        return [os.path.join(self.shared_dir, name) for name in os.listdir(self.shared_dir)
+                if name.endswith('.json') and name != ARCHIVE_NAME]
+
+    def _archive_dead(self):
+        """Fold the snapshots of exited processes into the archive"""
+        dead = []
+        for path in self._snapshot_files():
+            data = self._read_json(path)
+            if data is not None and not _pid_alive(data['pid']):
+                dead.append((path, data))
+        if not dead:
+            return
+        with self._directory_lock(exclusive=True):
+            archive_path = os.path.join(self.shared_dir, ARCHIVE_NAME)
+            archive = self._decode_snapshot(self._read_json(archive_path) or {})
+            folded = []
+            for path, data in dead:
+                if os.path.exists(path):
+                    self._merge(archive, self._decode_snapshot(data['metrics']), live=False)
+                    folded.append(path)
+            if folded:
+                self._write_json(ARCHIVE_NAME, self._encode_snapshot(archive))
+                for path in folded:
+                    os.remove(path)
+
+    def _shared_values(self):
+        """Sum of the archive and every live process's snapshot"""
+        self.flush()
+        self._archive_dead()
+        total = {}
+        with self._directory_lock(exclusive=False):
+            archive = self._read_json(os.path.join(self.shared_dir, ARCHIVE_NAME))
+            snapshots = [self._read_json(path) for path in self._snapshot_files()]
+        if archive:
+            self._merge(total, self._decode_snapshot(archive), live=False)
+        for data in snapshots:
+            if data is not None:
+                self._merge(total, self._decode_snapshot(data['metrics']))
+        return total
+
+    def render(self):
+        values = self._shared_values() if self.shared_dir else None
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render(None if values is None else values.get(metric.name, {})))
+        for name, help_text, callback, kind in self._collectors:
+            value = float(callback()) if values is None else values.get(name, 0.0)
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.append(f'{name} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+def clear_shared_metrics(directory):
+    """Remove the snapshots and archive of a previous server run (but not this process's snapshot)"""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(('.json', '.tmp')) and not name.startswith(f'{os.getpid()}-'):
+            os.remove(os.path.join(directory, name))
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    'ticket_stage_duration_seconds',
+    'Duration of each ticket generation stage (catalog_load, layout, render, send).',
+    labelnames=('stage',))
+GENERATION_SECONDS = REGISTRY.histogram(
+    'ticket_generation_duration_seconds',
+    'End-to-end duration of a ticket generation, from request to PDF bytes.',
+    labelnames=('mode', 'cache'))
+GENERATION_TICKETS = REGISTRY.histogram(
+    'ticket_generation_tickets', 'Tickets per generation.', buckets=COUNT_BUCKETS)
+GENERATION_PAGES = REGISTRY.histogram(
+    'ticket_generation_pages', 'Pages per generation.', buckets=COUNT_BUCKETS)
+GENERATION_BYTES_PER_TICKET = REGISTRY.histogram(
+    'ticket_generation_bytes_per_ticket', 'PDF size divided by the tickets in it.',
+    buckets=BYTES_PER_TICKET_BUCKETS)
+REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'HTTP request handling time by endpoint.',
+    labelnames=('endpoint', 'method', 'status'))
+GENERATION_ERRORS = REGISTRY.counter(
+    'ticket_generation_errors_total', 'Generations that raised an error.', labelnames=('mode',))
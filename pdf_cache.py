@@ -0,0 +1,119 @@
+"""
+Content-addressed cache of generated PDFs.
+
+Entries are keyed by a hash of the normalized ticket list, the layout
+parameters and the catalog version, and evicted least-recently-used once the
+cached PDFs exceed a total byte budget.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from pdf_generator import ticket_grid, ticket_quantity
+from ticket_output import render_pdf_bytes
+
+
+# Rendering options that change how a PDF is produced but not its content
+NON_LAYOUT_OPTIONS = {'workers', 'chunk_pages', 'debug', 'progress', 'stats'}
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def normalize_ticket(ticket):
+    """Reduce a ticket to exactly what is printed on it, and how many times"""
+    return [
+        str(ticket.get('quick_code', '')),
+        str(ticket.get('rubi_code', '')),
+        ticket['name'],
+        f"{ticket['rrp']:.2f}",
+        ticket_quantity(ticket),
+    ]
+
+
+def cache_key(tickets, layout, catalog_version):
+    """Hash of the printed ticket content (in order), layout parameters and catalog version"""
+    payload = json.dumps({
+        'tickets': [normalize_ticket(ticket) for ticket in tickets],
+        'layout': layout,
+        'catalog_version': catalog_version,
+    }, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class PdfCache:
+    """Thread-safe LRU cache of PDF bytes bounded by total size"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Return the cached PDF for key, or None, updating hit/miss counters"""
+        with self._lock:
+            data = self._entries.get(key)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return data
+
+    def put(self, key, data):
+        """Store a PDF, evicting least recently used entries to stay within max_bytes"""
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= len(previous)
+            self._entries[key] = data
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.total_bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def render_cached(cache, tickets, catalog_version=None, **options):
+    """
+    Return (pdf_bytes, cache_hit) for tickets, rendering with ReportLab only on a miss.
+    options are passed through to generate_price_tickets().
+    """
+    layout = {key: value for key, value in options.items() if key not in NON_LAYOUT_OPTIONS}
+    layout['grid'] = ticket_grid()
+    key = cache_key(tickets, layout, catalog_version)
+
+    data = cache.get(key)
+    if data is not None:
+        return data, True
+
+    data = render_pdf_bytes(tickets, **options)
+    cache.put(key, data)
+    return data, False
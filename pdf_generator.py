@@ -1,80 +1,570 @@
 from reportlab.lib.pagesizes import letter, A4
 from reportlab.lib.units import inch, mm, cm
 from reportlab.pdfgen import canvas
+from reportlab.pdfbase import pdfdoc
 from reportlab.lib import colors
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.platypus import Paragraph
 from reportlab.lib.enums import TA_CENTER, TA_LEFT
-from reportlab.pdfbase import pdfmetrics
+from reportlab.lib.utils import ImageReader
+from reportlab import rl_config
+from PIL import Image, ImageChops
+from text_layout import block_baselines, layout_text_block, wrap_lines
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+import io
+import multiprocessing
 import os
+import threading
+import time
 
 
-def generate_price_tickets(products, output_file, debug=False):
+LOGO_PATH = 'rubi.png'
+
+# Font used for all ticket text
+TICKET_FONT_NAME = 'Helvetica'
+TICKET_FONT_SIZE = 11
+
+# Name of the Form XObject holding the invariant ticket chrome
+TICKET_TEMPLATE_NAME = 'RubiTicketChrome'
+
+# Prefix of the Form XObjects holding a complete ticket that is printed many times.
+# Kept short: the name is repeated in the resources of every page that stamps the form
+TICKET_COPY_FORM_PREFIX = 'C'
+
+# Internal name of the resource dictionary shared by every copy form of a document
+TICKET_COPY_RESOURCES_NAME = 'RubiTicketCopyResources'
+
+# Tickets printed at least this many times are drawn once as a form and stamped.
+# Stamping is faster at any count, but each form's overhead makes the file
+# larger until about this many copies, so fewer copies are drawn directly.
+COPY_FORM_MIN_COPIES = 10
+
+# Compact output embeds the logo at no more than this resolution at its printed size
+COMPACT_LOGO_DPI = 300
+
+# A logo whose RGB channels never differ by more than this is embedded as greyscale
+GREY_TOLERANCE = 8
+
+
+def ticket_grid():
     """
-    Generate a PDF with price tickets for selected products.
-    Each ticket shows: Rubi Logo, Quick Code, Product Name, and RRP
-    Ticket dimensions: 6.09cm wide x 3.49cm tall
+    Page and ticket geometry for the A4 landscape ticket sheet.
+    Returns a dict with the page size, ticket size, margin, the cols x rows grid
+    and the spacing between tickets (all in points).
     """
     # Page setup - using A4 landscape to fit larger tickets
     page_width, page_height = A4
     # Swap for landscape
     page_width, page_height = page_height, page_width
-    
-    c = canvas.Canvas(output_file, pagesize=(page_width, page_height))
-    
+
     # Ticket dimensions (as specified: 6.09cm x 3.49cm)
     ticket_width = 6.09 * cm
     ticket_height = 3.49 * cm
     margin = 10 * mm
-    
+
     # Calculate how many tickets fit per page
     cols = int((page_width - 2 * margin) / (ticket_width + 5 * mm))
     rows = int((page_height - 2 * margin) / (ticket_height + 5 * mm))
-    tickets_per_page = cols * rows
-    
+
     # Calculate positions with spacing
     # If available spacing is negative (too many columns/rows), clamp to 0 so tickets keep their specified size
     x_spacing = (page_width - 2 * margin - (cols * ticket_width)) / (cols - 1) if cols > 1 else 0
     y_spacing = (page_height - 2 * margin - (rows * ticket_height)) / (rows - 1) if rows > 1 else 0
-    x_spacing = max(0, x_spacing)
-    y_spacing = max(0, y_spacing)
+
+    return {
+        'page_width': page_width,
+        'page_height': page_height,
+        'ticket_width': ticket_width,
+        'ticket_height': ticket_height,
+        'margin': margin,
+        'cols': cols,
+        'rows': rows,
+        'tickets_per_page': cols * rows,
+        'x_spacing': max(0, x_spacing),
+        'y_spacing': max(0, y_spacing),
+    }
+
+
+def ticket_position(grid, ticket_index):
+    """Lower-left corner (x, y) of the ticket at ticket_index on its page"""
+    page_position = ticket_index % grid['tickets_per_page']
+    col = page_position % grid['cols']
+    row = page_position // grid['cols']
+
+    x = grid['margin'] + col * (grid['ticket_width'] + grid['x_spacing'])
+    y = (grid['page_height'] - grid['margin'] - (row + 1) * grid['ticket_height']
+         - row * grid['y_spacing'])
+    return x, y
+
+
+def ticket_quantity(product):
+    """Number of copies to print of a product or custom ticket (its 'quantity', default 1)"""
+    return int(product.get('quantity') or 1)
+
+
+def ticket_count(products):
+    """Total number of tickets printed for products, counting quantities"""
+    return sum(ticket_quantity(product) for product in products)
+
+
+def expand_quantities(products):
+    """One entry per printed ticket: each product repeated quantity times, in order"""
+    expanded = []
+    for product in products:
+        quantity = ticket_quantity(product)
+        if quantity == 1:
+            expanded.append(product)
+        else:
+            expanded.extend([product] * quantity)
+    return expanded
+
+
+def ticket_content_key(product):
+    """What is printed on a ticket; tickets with equal keys look identical"""
+    return (str(product.get('quick_code', '')), str(product.get('rubi_code', '')),
+            product['name'], f"{product['rrp']:.2f}")
+
+
+def copy_form_names(products):
+    """
+    Form name for each ticket content printed COPY_FORM_MIN_COPIES times or
+    more in products (quantities already expanded), numbered in order of first
+    appearance. Computed once per document, so chunks rendered separately
+    make the same form/direct choice, with the same names, as a serial render.
+    """
+    copies = {}
+    for product in products:
+        key = ticket_content_key(product)
+        copies[key] = copies.get(key, 0) + 1
+    names = {}
+    for key, count in copies.items():
+        if count >= COPY_FORM_MIN_COPIES:
+            names[key] = f'{TICKET_COPY_FORM_PREFIX}{len(names)}'
+    return names
+
+
+def generate_price_tickets(products, output_file, debug=False, use_template=True,
+                           workers=1, chunk_pages=None, progress=None, stats=None, compact=False):
+    """
+    Generate a PDF with price tickets for selected products.
+    Each ticket shows: Rubi Logo, Quick Code, Product Name, and RRP
+    Ticket dimensions: 6.09cm wide x 3.49cm tall
+
+    A product with a 'quantity' is printed that many times in a row. Tickets
+    printed COPY_FORM_MIN_COPIES times or more (through a quantity or by
+    repeating a product) are drawn once into a Form XObject and every copy
+    references it.
+
+    With use_template (the default) the border, dividers and logo are recorded
+    once per document as a Form XObject and each ticket only references it and
+    draws its own text. use_template=False redraws everything per ticket.
+
+    compact=True makes the file as small as the printed result allows (see
+    compact_logo_image and binary_streams); it always uses the template.
+
+    With workers > 1 the tickets are split into chunks of whole pages
+    (chunk_pages pages each, default: spread evenly over the workers), rendered
+    in a process pool and merged back in order. Copy forms are chosen over the
+    whole document first, so each page's content stream is byte-identical to a
+    serial render and the merged file is about the same size. The pool starts
+    its workers with forkserver (spawn where unavailable), so scripts calling
+    this need the usual if __name__ == '__main__' guard.
+
+    progress, if given, is called as progress(tickets_done, pages_done) as
+    pages are completed.
+
+    Returns a stats dict with the ticket, distinct ticket and page counts,
+    layout_seconds and render_seconds (drawing and saving; in parallel mode the
+    wall time of the whole run, as layout overlaps in the workers). If a stats
+    dict is passed in, it is filled in and returned.
+    """
+    if stats is None:
+        stats = {}
+    stats['layout_seconds'] = 0.0
+    start = time.perf_counter()
+    grid = ticket_grid()
 
     # Debug printouts to help verify sizes (in points and cm)
     if debug:
-        print("PAGE (points):", page_width, "x", page_height)
-        print("PAGE (cm):", page_width / cm, "x", page_height / cm)
-        print("MARGIN (mm):", margin / mm)
-        print("TICKET (points):", ticket_width, "x", ticket_height)
-        print("TICKET (cm):", ticket_width / cm, "x", ticket_height / cm)
-        print("COLS x ROWS:", cols, "x", rows, "=> tickets_per_page:", tickets_per_page)
-        print("x_spacing (points/mm):", x_spacing, "/", x_spacing / mm)
-        print("y_spacing (points/mm):", y_spacing, "/", y_spacing / mm)
-    
+        print("PAGE (points):", grid['page_width'], "x", grid['page_height'])
+        print("PAGE (cm):", grid['page_width'] / cm, "x", grid['page_height'] / cm)
+        print("MARGIN (mm):", grid['margin'] / mm)
+        print("TICKET (points):", grid['ticket_width'], "x", grid['ticket_height'])
+        print("TICKET (cm):", grid['ticket_width'] / cm, "x", grid['ticket_height'] / cm)
+        print("COLS x ROWS:", grid['cols'], "x", grid['rows'], "=> tickets_per_page:", grid['tickets_per_page'])
+        print("x_spacing (points/mm):", grid['x_spacing'], "/", grid['x_spacing'] / mm)
+        print("y_spacing (points/mm):", grid['y_spacing'], "/", grid['y_spacing'] / mm)
+
+    products = expand_quantities(products)
+    if compact:
+        use_template = True
+    output_start = output_file.tell() if hasattr(output_file, 'tell') else 0
+
+    if workers > 1 and len(products) > grid['tickets_per_page']:
+        generate_price_tickets_parallel(products, output_file, grid, use_template, workers, chunk_pages,
+                                        progress, stats, compact)
+        stats['render_seconds'] = time.perf_counter() - start
+    else:
+        render_ticket_document(products, output_file, grid, use_template, progress, stats, compact)
+        stats['render_seconds'] = time.perf_counter() - start - stats['layout_seconds']
+
+    stats['tickets'] = len(products)
+    stats['distinct_tickets'] = len({ticket_content_key(product) for product in products})
+    stats['pages'] = -(-len(products) // grid['tickets_per_page'])
+    if hasattr(output_file, 'tell'):
+        stats['bytes'] = output_file.tell() - output_start
+    else:
+        stats['bytes'] = os.path.getsize(output_file)
+    stats['bytes_per_ticket'] = stats['bytes'] / len(products) if products else 0.0
+    return stats
+
+
+# Callers currently inside binary_streams(), and the ASCII85 setting to restore after them
+_binary_streams_lock = threading.Lock()
+_binary_streams_users = 0
+_binary_streams_saved = None
+
+
+@contextmanager
+def binary_streams():
+    """
+    Write PDF streams as raw Flate data rather than ASCII85 text, which is a
+    quarter larger. ReportLab only has a process-wide switch for this, so other
+    documents rendered in the process meanwhile are written the same way (both
+    are valid PDF; binary streams are just smaller).
+    """
+    global _binary_streams_users, _binary_streams_saved
+    with _binary_streams_lock:
+        if _binary_streams_users == 0:
+            _binary_streams_saved = rl_config.useA85
+            rl_config.useA85 = 0
+        _binary_streams_users += 1
+    try:
+        yield
+    finally:
+        with _binary_streams_lock:
+            _binary_streams_users -= 1
+            if _binary_streams_users == 0:
+                rl_config.useA85 = _binary_streams_saved
+
+
+def render_ticket_document(products, output_file, grid, use_template=True, progress=None, stats=None,
+                           compact=False, form_names=None):
+    """
+    Draw all tickets onto a single canvas and save it to output_file (path or
+    file object). form_names defaults to copy_form_names(products).
+    """
+    if not compact:
+        c = canvas.Canvas(output_file, pagesize=(grid['page_width'], grid['page_height']))
+        draw_ticket_pages(c, products, grid, use_template, progress, stats, form_names=form_names)
+        c.save()
+        return
+    with binary_streams():
+        c = canvas.Canvas(output_file, pagesize=(grid['page_width'], grid['page_height']), pageCompression=1)
+        logo = compact_logo_image(grid['ticket_width'], grid['ticket_height'])
+        draw_ticket_pages(c, products, grid, use_template, progress, stats, logo, form_names)
+        c.save()
+
+
+def draw_ticket_pages(c, products, grid, use_template=True, progress=None, stats=None, logo=None,
+                      form_names=None):
+    """
+    Draw one ticket per entry of products onto canvas c, starting a new page
+    whenever the grid is full. Quantities are not expanded here (see
+    expand_quantities); tickets named in form_names (by default
+    copy_form_names(products)) are drawn once as a form and placed by
+    reference. logo replaces the default logo_image() in the template.
+    """
+    ticket_width = grid['ticket_width']
+    ticket_height = grid['ticket_height']
+    tickets_per_page = grid['tickets_per_page']
+
+    if form_names is None:
+        form_names = copy_form_names(products)
+    # Forms already defined on this canvas
+    defined_forms = set()
+
+    # Lay out each distinct name up front so drawing below only hits the layout cache
+    start = time.perf_counter()
+    for name in {product['name'] for product in products}:
+        layout_ticket_name(name, ticket_width, ticket_height)
+    if stats is not None:
+        stats['layout_seconds'] = stats.get('layout_seconds', 0.0) + time.perf_counter() - start
+
+    if use_template:
+        define_ticket_template(c, ticket_width, ticket_height, logo)
+
     ticket_count = 0
     
     for product in products:
         # Calculate position
-        page_position = ticket_count % tickets_per_page
-        col = page_position % cols
-        row = page_position // cols
-        
-        x = margin + col * (ticket_width + x_spacing)
-        y = page_height - margin - (row + 1) * ticket_height - row * y_spacing
+        x, y = ticket_position(grid, ticket_count)
         
         # Draw ticket
-        draw_ticket(c, x, y, ticket_width, ticket_height, product)
+        form_name = form_names.get(ticket_content_key(product)) if form_names else None
+        if form_name is not None:
+            if form_name not in defined_forms:
+                defined_forms.add(form_name)
+                define_ticket_copy(c, form_name, ticket_width, ticket_height, product, use_template)
+            place_form(c, form_name, x, y)
+        elif use_template:
+            place_ticket_template(c, x, y)
+            draw_ticket_fields(c, x, y, ticket_width, ticket_height, product)
+        else:
+            draw_ticket(c, x, y, ticket_width, ticket_height, product)
         
         ticket_count += 1
         
         # New page if needed
         if ticket_count % tickets_per_page == 0 and ticket_count < len(products):
             c.showPage()
+            if progress:
+                progress(ticket_count, ticket_count // tickets_per_page)
     
-    c.save()
+    if progress:
+        progress(ticket_count, -(-ticket_count // tickets_per_page))
+
+
+def page_aligned_chunks(products, tickets_per_page, chunk_pages):
+    """Split products into consecutive slices that each fill exactly chunk_pages pages (the last may be short)"""
+    chunk_size = tickets_per_page * max(1, chunk_pages)
+    return [products[start:start + chunk_size] for start in range(0, len(products), chunk_size)]
+
+
+def _render_chunk(args):
+    """Process pool worker: render one chunk of tickets and return (PDF bytes, layout seconds)"""
+    products, grid, use_template, compact, form_names = args
+    buffer = io.BytesIO()
+    stats = {}
+    render_ticket_document(products, buffer, grid, use_template, stats=stats, compact=compact,
+                           form_names=form_names)
+    return buffer.getvalue(), stats['layout_seconds']
+
+
+def _pool_context():
+    """
+    Start pool workers from a clean forkserver (or spawn) process instead of
+    forking the caller, which may be a threaded web worker holding I/O or
+    logging locks that the child would inherit locked.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+def generate_price_tickets_parallel(products, output_file, grid, use_template=True, workers=2, chunk_pages=None,
+                                    progress=None, stats=None, compact=False):
+    """Render page-aligned chunks in a process pool and merge them into one PDF in order"""
+    from pypdf import PdfReader, PdfWriter
+
+    tickets_per_page = grid['tickets_per_page']
+    total_pages = -(-len(products) // tickets_per_page)
+    if chunk_pages is None:
+        chunk_pages = -(-total_pages // workers)
+    chunks = page_aligned_chunks(products, tickets_per_page, chunk_pages)
+    # Decided over the whole document, so every chunk stamps the same tickets as forms
+    form_names = copy_form_names(products)
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(chunks)), mp_context=_pool_context()) as executor:
+        rendered = []
+        tickets_done = 0
+        for chunk, (chunk_pdf, layout_seconds) in zip(
+                chunks, executor.map(_render_chunk, [(chunk, grid, use_template, compact, form_names)
+                                                     for chunk in chunks])):
+            rendered.append(chunk_pdf)
+            if stats is not None:
+                stats['layout_seconds'] = stats.get('layout_seconds', 0.0) + layout_seconds
+            tickets_done += len(chunk)
+            if progress:
+                progress(tickets_done, -(-tickets_done // tickets_per_page))
+
+    writer = PdfWriter()
+    for chunk_pdf in rendered:
+        writer.append(PdfReader(io.BytesIO(chunk_pdf)))
+    # Every chunk embeds its own fonts, logo, template and copy forms; keep the first of each
+    shared = {}
+    for page in writer.pages:
+        _share_resources(page['/Resources'].get_object(), shared)
+    # The replaced copies are still in the writer; re-reading the merge keeps only what the pages use
+    merged = io.BytesIO()
+    writer.write(merged)
+    merged.seek(0)
+    PdfWriter(clone_from=PdfReader(merged)).write(output_file)
+
+
+def _share_resources(resources, shared):
+    """
+    Point the fonts and XObjects in a merged chunk's resources (and in the
+    forms they use) at the first chunk's objects of the same name. Names match
+    across chunks: fonts are numbered in the same order in every chunk, images
+    are named by content and forms by copy_form_names().
+    """
+    from pypdf.generic import NameObject
+
+    for category in ('/Font', '/XObject'):
+        if category not in resources:
+            continue
+        entries = resources[category].get_object()
+        for name in list(entries):
+            obj = entries[name].get_object()
+            key = (category, name, obj.get('/BaseFont'))
+            if key in shared:
+                entries[NameObject(name)] = shared[key]
+            else:
+                shared[key] = entries.raw_get(name)
+                if '/Resources' in obj:
+                    _share_resources(obj['/Resources'].get_object(), shared)
+
+
+def define_ticket_template(c, width, height, logo=None):
+    """Record the invariant ticket chrome once as a Form XObject on this canvas"""
+    # Pad the bounding box so the 1pt border stroke is not clipped at the edges
+    c.beginForm(TICKET_TEMPLATE_NAME, -1, -1, width + 1, height + 1)
+    draw_ticket_chrome(c, 0, 0, width, height, logo)
+    c.endForm()
+
+
+def place_ticket_template(c, x, y):
+    """Reference the compiled ticket chrome with its lower-left corner at (x, y)"""
+    place_form(c, TICKET_TEMPLATE_NAME, x, y)
+
+
+def define_ticket_copy(c, name, width, height, product, use_template=True):
+    """Record one complete ticket (chrome and fields) as a Form XObject for placing many times"""
+    c.beginForm(name, -1, -1, width + 1, height + 1)
+    if use_template:
+        place_ticket_template(c, 0, 0)
+        draw_ticket_fields(c, 0, 0, width, height, product)
+    else:
+        draw_ticket(c, 0, 0, width, height, product)
+    c.endForm()
+    slim_copy_form(c, name)
+
+
+class TicketCopyForm(pdfdoc.PDFObject):
+    """
+    Form XObject for a ticket copy with only the entries PDF requires: a Flate
+    stream (never ASCII85), the bounding box and a reference to resources
+    shared by all copy forms. ReportLab's own forms also repeat a ProcSet, the
+    identity Matrix, FormType and the XObject dictionary in each of them.
+    """
+
+    def __init__(self, stream, bbox, resources):
+        self.stream = stream
+        self.bbox = bbox
+        self.resources = resources
+
+    def format(self, document):
+        contents = pdfdoc.PDFStream(content=self.stream, filters=[pdfdoc.PDFZCompress])
+        contents.dictionary['Type'] = pdfdoc.PDFName('XObject')
+        contents.dictionary['Subtype'] = pdfdoc.PDFName('Form')
+        contents.dictionary['BBox'] = pdfdoc.PDFArray(self.bbox)
+        contents.dictionary['Resources'] = self.resources
+        return contents.format(document)
+
+
+def slim_copy_form(c, name):
+    """
+    Swap the form ReportLab just recorded as name for a TicketCopyForm with the
+    same drawing, minus the canvas preamble (the fields set their own font).
+    Every copy draws the same chrome, so the first form's resources serve all.
+    """
+    doc = c._doc
+    internal_name = doc.getXObjectName(name)
+    form = doc.idToObject[internal_name]
+    preamble = pdfdoc.pdfdocEnc(c._preamble + '\n')
+    stream = form.stream[len(preamble):] if form.stream.startswith(preamble) else form.stream
+    if TICKET_COPY_RESOURCES_NAME not in doc.idToObject:
+        resources = pdfdoc.PDFResourceDictionary()
+        resources.basicFonts()
+        resources.XObject = form.XObjects
+        doc.Reference(resources, TICKET_COPY_RESOURCES_NAME)
+    slim = TicketCopyForm(stream, form.BBoxList(), pdfdoc.PDFObjectReference(TICKET_COPY_RESOURCES_NAME))
+    slim.__InternalName__ = internal_name
+    doc.idToObject[internal_name] = slim
+
+
+def place_form(c, name, x, y):
+    """Reference the form called name with its lower-left corner at (x, y)"""
+    c.saveState()
+    c.translate(x, y)
+    c.doForm(name)
+    c.restoreState()
 
 
 def draw_ticket(c, x, y, width, height, product):
     """Draw a single price ticket matching the Rubi design"""
+    draw_ticket_chrome(c, x, y, width, height)
+    draw_ticket_fields(c, x, y, width, height, product)
+
+
+@lru_cache(maxsize=None)
+def logo_image():
+    """
+    The decoded logo, read once per process and reused for every document
+    (None if the logo file is missing). Loading it before a server forks its
+    workers lets them all share it.
+    """
+    if not os.path.exists(LOGO_PATH):
+        return None
+    try:
+        image = ImageReader(LOGO_PATH)
+        # ImageReader decodes lazily; force it now so the pixels are shared too
+        image.getRGBData()
+    except Exception:
+        return None
+    return image
+
+
+def logo_box(width, height):
+    """(padding, available_width, available_height) of the logo on a ticket of the given size"""
+    # Logo section on the left (approximately 1/3 of width), with minimal padding
+    logo_padding = 0.5 * mm
+    return logo_padding, width * 0.35 - 2 * logo_padding, height - 2 * logo_padding
+
+
+@lru_cache(maxsize=None)
+def compact_logo_image(width, height):
+    """
+    The logo prepared for compact output on tickets of the given size:
+    flattened onto white (no soft mask), greyscale if it has no colour, and
+    downsampled to COMPACT_LOGO_DPI at its printed size. None if there is no logo.
+    """
+    if not os.path.exists(LOGO_PATH):
+        return None
+    try:
+        image = Image.open(LOGO_PATH)
+        image.load()
+    except Exception:
+        return None
+    if image.mode in ('RGBA', 'LA', 'P') or 'transparency' in image.info:
+        image = image.convert('RGBA')
+        image = Image.alpha_composite(Image.new('RGBA', image.size, 'white'), image)
+    image = image.convert('RGB')
+    red, green, blue = image.split()
+    if max(ImageChops.difference(red, green).getextrema()[1],
+           ImageChops.difference(green, blue).getextrema()[1]) <= GREY_TOLERANCE:
+        image = image.convert('L')
+
+    # drawImage fits the logo into the box keeping its aspect ratio
+    _, available_width, available_height = logo_box(width, height)
+    printed_scale = min(available_width / image.width, available_height / image.height)
+    max_width = round(image.width * printed_scale / 72 * COMPACT_LOGO_DPI)
+    if max_width < image.width:
+        image = image.resize((max_width, max(1, round(image.height * max_width / image.width))),
+                             Image.LANCZOS)
+    return ImageReader(image)
+
+
+def draw_ticket_chrome(c, x, y, width, height, logo=None):
+    """
+    Draw the parts of a ticket that are the same for every product: border,
+    dividers and logo (logo_image() unless another ImageReader is given)
+    """
     # Draw outer border (black, 1pt)
     c.setStrokeColor(colors.black)
     c.setLineWidth(1)
@@ -88,19 +578,18 @@ def draw_ticket(c, x, y, width, height, product):
     c.line(x + logo_width, y, x + logo_width, y + height)
     
     # Draw Rubi logo in the left section
-    logo_path = 'rubi.png'
-    if os.path.exists(logo_path):
+    if logo is None:
+        logo = logo_image()
+    if logo is not None:
         # Calculate logo dimensions to fit with minimal padding - make it bigger
-        logo_padding = 0.5 * mm
-        available_width = logo_width - (2 * logo_padding)
-        available_height = height - (2 * logo_padding)
+        logo_padding, available_width, available_height = logo_box(width, height)
         
         # Center the logo
         logo_x = x + logo_padding
         logo_y = y + logo_padding
         
         try:
-            c.drawImage(logo_path, logo_x, logo_y, 
+            c.drawImage(logo, logo_x, logo_y, 
                        width=available_width, 
                        height=available_height,
                        preserveAspectRatio=True, 
@@ -120,122 +609,90 @@ def draw_ticket(c, x, y, width, height, product):
         text_width = c.stringWidth(rubi_text, "Helvetica-Bold", 12)
         c.drawString(x + (logo_width - text_width) / 2, y + height / 2 - 4, rubi_text)
     
-    # Right section with product details
-    right_x = x + logo_width + 1.5 * mm  # Reduced left padding
-    right_width = width - logo_width - 3 * mm
-    
     # Horizontal divider lines in right section with exact heights
+    c.setLineWidth(1)
+    for x1, y1, x2, y2 in ticket_dividers(width, height)[1:]:
+        c.line(x + x1, y + y1, x + x2, y + y2)
+
+
+def ticket_sections(height):
+    """Heights of the QC, name and RRP sections in the right half of a ticket"""
     # Top section for QC code - 1.06cm
     qc_section_height = 1.06 * cm
     # Middle section for product name - 1.63cm
     name_section_height = 1.63 * cm
     # Bottom section for RRP - remaining height
     rrp_section_height = height - qc_section_height - name_section_height
-    
-    # Draw horizontal dividers
-    c.setLineWidth(1)
-    c.line(x + logo_width, y + height - qc_section_height, x + width, y + height - qc_section_height)
-    c.line(x + logo_width, y + rrp_section_height, x + width, y + rrp_section_height)
-    
-    # QC Code (top right section) - vertically centered, two lines (QC and RU)
-    # Use font metrics (points) so units are consistent with canvas coordinates
-    font_name_qc = "Helvetica"
-    font_size_qc = 11
-    c.setFont(font_name_qc, font_size_qc)
-    c.setFillColor(colors.black)
+    return qc_section_height, name_section_height, rrp_section_height
 
-    # Get ascent/descent in points and compute line height + leading
-    ascent_qc = pdfmetrics.getAscent(font_name_qc, font_size_qc)
-    descent_qc = abs(pdfmetrics.getDescent(font_name_qc, font_size_qc))
-    line_height_qc = ascent_qc + descent_qc
-    leading_qc = font_size_qc * 0.2
 
-    # Two-line block total height
-    total_block_height = 2 * line_height_qc + leading_qc
+def ticket_dividers(width, height):
+    """
+    The divider lines of a ticket as (x1, y1, x2, y2) in points from its
+    lower-left corner: after the logo, under the codes and above the RRP
+    """
+    logo_width = width * 0.35
+    qc_section_height, name_section_height, rrp_section_height = ticket_sections(height)
+    return (
+        (logo_width, 0, logo_width, height),
+        (logo_width, height - qc_section_height, width, height - qc_section_height),
+        (logo_width, rrp_section_height, width, rrp_section_height),
+    )
 
-    # QC section top and bottom in canvas coordinates
-    qc_section_top = y + height
-    qc_section_bottom = qc_section_top - qc_section_height
 
-    # Vertical space to leave above the text block to vertically center it
-    space_top = (qc_section_height - total_block_height) / 2.0
+def ticket_field_layout(width, height, product):
+    """
+    Where the per-product text of a ticket goes, shared by every output backend.
+    Returns (x, baseline_y, text) tuples in points from the ticket's lower-left
+    corner, all set in TICKET_FONT_NAME at TICKET_FONT_SIZE.
+    """
+    # Logo section on the left (approximately 1/3 of width)
+    logo_width = width * 0.35
 
-    # Baseline for first line: top_of_block = baseline + ascent => baseline = top_of_block - ascent
-    top_of_block = qc_section_top - space_top
-    first_baseline = top_of_block - ascent_qc
+    # Right section with product details
+    right_x = logo_width + 1.5 * mm  # Reduced left padding
 
-    # Draw QC then RU on the next baseline down
-    c.drawString(right_x, first_baseline, f"QC: {product.get('quick_code', '')}")
-    second_baseline = first_baseline - (line_height_qc + leading_qc)
-    c.drawString(right_x, second_baseline, f"RU: {product.get('rubi_code', '')}")
-    
-    # Product Name (middle right section) - vertically centered, size 11, NOT BOLD
-    font_name = "Helvetica"
-    font_size = 11
-    c.setFont(font_name, font_size)
-
-    # Wrap product name if too long
-    name_lines = wrap_text(product['name'], right_width - 2 * mm, c, font_name, font_size)
-
-    # Use font metrics for vertical centering (works for 1 or 2 lines)
-    ascent = pdfmetrics.getAscent(font_name, font_size)
-    descent = abs(pdfmetrics.getDescent(font_name, font_size))
-    line_height = ascent + descent
-    leading = font_size * 0.2
-
-    num_lines = min(len(name_lines), 2)
-    total_text_height = num_lines * line_height + (num_lines - 1) * leading
-
-    # Name section top and bottom in points
-    section_bottom = y + rrp_section_height
-    section_top = section_bottom + name_section_height
-
-    # Space to leave above the text block to vertically center it
-    space_top = (name_section_height - total_text_height) / 2.0
-
-    # Baseline for first line: top_of_block = baseline + ascent => baseline = top_of_block - ascent
-    top_of_block = section_top - space_top
-    first_baseline = top_of_block - ascent
-
-    # Draw each line at its baseline, preserving the leading gap
-    for i, line in enumerate(name_lines[:num_lines]):
-        baseline = first_baseline - i * (line_height + leading)
-        c.drawString(right_x, baseline, line)
-    
-    # RRP (bottom right section) - vertically centered, size 11, NOT BOLD
-    c.setFont("Helvetica", 11)
-    c.setFillColor(colors.black)
-    
-    # Build the full RRP text on one line
+    qc_section_height, name_section_height, rrp_section_height = ticket_sections(height)
+    fields = []
+
+    # QC Code (top right section) - vertically centered, two lines (QC and RU)
+    qc_baseline, ru_baseline = block_baselines(2, TICKET_FONT_NAME, TICKET_FONT_SIZE, qc_section_height)
+    fields.append((right_x, height - qc_baseline, f"QC: {product.get('quick_code', '')}"))
+    fields.append((right_x, height - ru_baseline, f"RU: {product.get('rubi_code', '')}"))
+
+    # Product Name (middle right section) - wrapped to at most two lines, vertically centered
+    name_section_top = rrp_section_height + name_section_height
+    for offset, line in layout_ticket_name(product['name'], width, height):
+        fields.append((right_x, name_section_top - offset, line))
+
+    # RRP (bottom right section) - vertically centered on one line
     rrp_text = f"RRP: £{product['rrp']:.2f}"
-    
-    # Calculate vertical center of RRP section (remaining height)
     rrp_text_height = 11 * 0.352778  # Approximate height in mm for font size 11
-    rrp_y = y + rrp_section_height / 2 - rrp_text_height / 2
-    
-    c.drawString(right_x, rrp_y, rrp_text)
-    
+    fields.append((right_x, rrp_section_height / 2 - rrp_text_height / 2, rrp_text))
+    return fields
+
+
+def draw_ticket_fields(c, x, y, width, height, product):
+    """Draw the per-product text of a ticket: QC/RU codes, name and RRP"""
+    # All text on the ticket is Helvetica 11, NOT BOLD
+    c.setFont(TICKET_FONT_NAME, TICKET_FONT_SIZE)
     c.setFillColor(colors.black)
+    for field_x, field_y, text in ticket_field_layout(width, height, product):
+        c.drawString(x + field_x, y + field_y, text)
+
+
+def layout_ticket_name(name, width, height):
+    """
+    Wrapped, vertically centred lines of a product name for a ticket of the given size.
+    Returns (offset_from_name_section_top, line) pairs; results are cached.
+    """
+    logo_width = width * 0.35
+    right_width = width - logo_width - 3 * mm
+    qc_section_height, name_section_height, rrp_section_height = ticket_sections(height)
+    return layout_text_block(name, TICKET_FONT_NAME, TICKET_FONT_SIZE,
+                             right_width - 2 * mm, name_section_height)
 
 
 def wrap_text(text, max_width, canvas_obj, font_name, font_size):
-    """Simple text wrapping function"""
-    words = text.split()
-    lines = []
-    current_line = []
-    
-    for word in words:
-        test_line = ' '.join(current_line + [word])
-        width = canvas_obj.stringWidth(test_line, font_name, font_size)
-        
-        if width <= max_width:
-            current_line.append(word)
-        else:
-            if current_line:
-                lines.append(' '.join(current_line))
-            current_line = [word]
-    
-    if current_line:
-        lines.append(' '.join(current_line))
-    
-    return lines
+    """Simple text wrapping function (cached; canvas_obj is kept for compatibility)"""
+    return list(wrap_lines(text, font_name, font_size, max_width))
@@ -0,0 +1,643 @@
+const JOB_POLL_INTERVAL_MS = 1000;
+
+// Parse a JSON response; error pages from the server or a proxy (413, 502, ...) become an error result
+async function readJsonResponse(response) {
+    try {
+        return await response.json();
+    } catch (error) {
+        return {success: false, error: `The server answered ${response.status} ${response.statusText}.`};
+    }
+}
+
+// Poll a background generation job, showing its progress; returns the finished job, or null after showing the error
+async function waitForGenerationJob(statusUrl) {
+    while (true) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+        const statusResponse = await fetch(statusUrl);
+        const status = await readJsonResponse(statusResponse);
+        
+        if (!status.success) {
+            showMessage(status.error || 'Lost track of the generation job.', 'error');
+            return null;
+        }
+        
+        const job = status.job;
+        if (job.status === 'done') {
+            return job;
+        }
+        if (job.status === 'failed') {
+            showMessage(`Error generating PDF: ${job.error}`, 'error');
+            return null;
+        }
+        showMessage(`Generating PDF tickets... ${job.tickets_done} of ${job.total_tickets} tickets (${job.pages_done} of ${job.total_pages} pages)`, 'success');
+    }
+}
+
+// Submit a background generation job, poll its progress and download the result
+async function generateInBackground(form, totalCount) {
+    const generateBtn = document.getElementById('generateBtn');
+    generateBtn.disabled = true;
+    showMessage(`Queued ${totalCount} tickets for generation...`, 'success');
+    // The custom tickets handed to the job leave the draft once it is done
+    const jobTicketIds = Array.from(document.getElementById('customTicketsList').children,
+                                    ticket => ticket.dataset.ticketId);
+    
+    try {
+        // Sent urlencoded: multipart bodies are limited to 1,000 fields, less than a large selection
+        const response = await fetch(JOB_SUBMIT_URL, {
+            method: 'POST',
+            body: new URLSearchParams(new FormData(form))
+        });
+        const result = await readJsonResponse(response);
+        
+        if (!result.success) {
+            showMessage(result.error || 'Failed to start ticket generation.', 'error');
+            return;
+        }
+        
+        const job = await waitForGenerationJob(result.status_url);
+        if (job) {
+            const ticketsList = document.getElementById('customTicketsList');
+            for (const ticketId of jobTicketIds) {
+                const ticketElement = ticketsList.querySelector(`[data-ticket-id="${ticketId}"]`);
+                if (ticketElement) {
+                    ticketElement.remove();
+                }
+            }
+            if (ticketsList.children.length === 0) {
+                document.getElementById('customTicketsHeader').style.display = 'none';
+            }
+            updateCount();
+            showMessage(`Successfully generated tickets for ${job.total_tickets} products! Download should start automatically.`, 'success');
+            window.location = result.download_url;
+        }
+    } catch (error) {
+        console.error('Background generation failed:', error);
+        showMessage('Network error during ticket generation. Please check your connection and try again.', 'error');
+    } finally {
+        generateBtn.disabled = false;
+    }
+}
+
+// AJAX function to add custom ticket
+async function addCustomTicketAjax() {
+    // Get values from visible form fields
+    const quickCode = document.getElementById('custom_quick_code').value.trim();
+    const name = document.getElementById('custom_name').value.trim();
+    const rrp = document.getElementById('custom_rrp').value.trim();
+    const quantity = document.getElementById('custom_quantity').value.trim() || '1';
+    
+    // Basic validation
+    if (!quickCode) {
+        showMessage('Quick code is required for a custom ticket.', 'error');
+        return;
+    }
+    if (!name) {
+        showMessage('Product name is required for a custom ticket.', 'error');
+        return;
+    }
+    if (!rrp) {
+        showMessage('RRP is required for a custom ticket.', 'error');
+        return;
+    }
+    
+    // Disable the button to prevent double-submission
+    const addBtn = document.getElementById('addCustomBtn');
+    const originalText = addBtn.textContent;
+    addBtn.disabled = true;
+    addBtn.textContent = 'Adding...';
+    
+    try {
+        const response = await fetch(ADD_CUSTOM_URL, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                quick_code: quickCode,
+                name: name,
+                rrp: rrp,
+                quantity: quantity
+            })
+        });
+        
+        const result = await response.json();
+        
+        if (result.success) {
+            // Add the ticket to the UI
+            addTicketToUI(result.ticket);
+            
+            // Clear the form fields
+            document.getElementById('custom_quick_code').value = '';
+            document.getElementById('custom_name').value = '';
+            document.getElementById('custom_rrp').value = '';
+            document.getElementById('custom_quantity').value = '1';
+            
+            // Update the count
+            updateCount();
+            
+            showMessage(result.message, 'success');
+        } else {
+            showMessage(result.error || 'Failed to add custom ticket.', 'error');
+        }
+    } catch (error) {
+        console.error('Error adding custom ticket:', error);
+        showMessage('Network error adding custom ticket. Please check your connection and try again.', 'error');
+    } finally {
+        // Re-enable the button
+        addBtn.disabled = false;
+        addBtn.textContent = originalText;
+    }
+}
+
+// Upload a CSV/XLSX file of custom tickets; invalid rows are listed, valid rows are added,
+// or with "generate now" ticked printed straight away by a background job
+async function uploadCustomTicketsAjax() {
+    const fileInput = document.getElementById('customUploadFile');
+    const errorList = document.getElementById('customUploadErrors');
+    const generateNow = document.getElementById('customUploadGenerate').checked;
+    if (!fileInput.files.length) {
+        showMessage('Choose a CSV or XLSX file to upload.', 'error');
+        return;
+    }
+    
+    const uploadBtn = document.getElementById('uploadCustomBtn');
+    const originalText = uploadBtn.textContent;
+    uploadBtn.disabled = true;
+    uploadBtn.textContent = 'Uploading...';
+    errorList.innerHTML = '';
+    
+    const formData = new FormData();
+    formData.append('file', fileInput.files[0]);
+    if (generateNow) {
+        formData.append('generate', '1');
+    }
+    
+    try {
+        const response = await fetch(UPLOAD_CUSTOM_URL, {
+            method: 'POST',
+            body: formData
+        });
+        const result = await readJsonResponse(response);
+        
+        (result.errors || []).forEach(error => {
+            errorList.insertAdjacentHTML('beforeend', `<li>Row ${error.row}: ${escapeHtml(error.error)}</li>`);
+        });
+        
+        if (result.success && result.job) {
+            // Sent straight to a generation job; the tickets are not added to the draft
+            fileInput.value = '';
+            uploadBtn.textContent = 'Generating...';
+            showMessage(`Queued ${result.job.total_tickets} tickets for generation` + (result.skipped ? `, skipped ${result.skipped} invalid rows...` : '...'), 'success');
+            const job = await waitForGenerationJob(result.status_url);
+            if (job) {
+                showMessage(`Successfully generated tickets for ${job.total_tickets} products! Download should start automatically.`, 'success');
+                window.location = result.download_url;
+            }
+        } else if (result.success) {
+            result.tickets.forEach(addTicketToUI);
+            fileInput.value = '';
+            updateCount();
+            showMessage(result.message, 'success');
+        } else {
+            showMessage(result.error || 'Failed to upload custom tickets.', 'error');
+        }
+    } catch (error) {
+        console.error('Error uploading custom tickets:', error);
+        showMessage('Network error uploading custom tickets. Please check your connection and try again.', 'error');
+    } finally {
+        uploadBtn.disabled = false;
+        uploadBtn.textContent = originalText;
+    }
+}
+
+// AJAX function to remove custom ticket
+async function removeCustomTicketAjax(ticketId) {
+    if (!confirm('Are you sure you want to remove this custom ticket?')) {
+        return;
+    }
+    
+    // Find and disable the remove button
+    const ticketElement = document.querySelector(`[data-ticket-id="${ticketId}"]`);
+    const removeBtn = ticketElement ? ticketElement.querySelector('button') : null;
+    
+    if (removeBtn) {
+        removeBtn.disabled = true;
+        removeBtn.textContent = 'Removing...';
+    }
+    
+    try {
+        const response = await fetch(REMOVE_CUSTOM_URL, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({
+                ticket_id: ticketId
+            })
+        });
+        
+        const result = await response.json();
+        
+        if (result.success) {
+            // Remove the ticket from the UI
+            removeTicketFromUI(ticketId);
+            
+            // Update the count
+            updateCount();
+            
+            showMessage(result.message, 'success');
+        } else {
+            // Re-enable button on error
+            if (removeBtn) {
+                removeBtn.disabled = false;
+                removeBtn.textContent = 'Remove';
+            }
+            showMessage(result.error || 'Failed to remove custom ticket.', 'error');
+        }
+    } catch (error) {
+        // Re-enable button on error
+        if (removeBtn) {
+            removeBtn.disabled = false;
+            removeBtn.textContent = 'Remove';
+        }
+        console.error('Error removing custom ticket:', error);
+        showMessage('Network error removing custom ticket. Please check your connection and try again.', 'error');
+    }
+}
+
+// Function to add a ticket to the UI
+function addTicketToUI(ticket) {
+    const ticketsList = document.getElementById('customTicketsList');
+    const ticketsHeader = document.getElementById('customTicketsHeader');
+    
+    // Show the header if it's hidden
+    ticketsHeader.style.display = 'block';
+    
+    // Create the ticket HTML with initial opacity 0 for animation
+    const quantity = ticket.quantity || 1;
+    const ticketHTML = `
+        <div class="flex items-center justify-between p-4 bg-[#1e1e2e] border border-[#89b4fa]/50 rounded-lg opacity-0 transform scale-95 transition-all duration-300" data-ticket-id="${ticket.id}" data-quantity="${quantity}">
+            <div class="flex items-center gap-4">
+                <span class="font-mono text-sm font-semibold text-[#89b4fa]">${escapeHtml(ticket.quick_code)}</span>
+                <span class="text-gray-200">${escapeHtml(ticket.name)}</span>
+                <span class="font-bold text-white">£${ticket.rrp.toFixed(2)}</span>
+                ${quantity > 1 ? `<span class="text-sm text-gray-300">&times; ${quantity}</span>` : ''}
+            </div>
+            <button type="button" class="px-3 py-1 bg-red-900/30 hover:bg-red-800/50 text-red-300 text-sm rounded-md transition-colors" onclick="removeCustomTicketAjax('${ticket.id}')">Remove</button>
+        </div>
+    `;
+    
+    // Add the ticket to the list
+    ticketsList.insertAdjacentHTML('beforeend', ticketHTML);
+    
+    // Animate in the new ticket
+    const newTicket = ticketsList.lastElementChild;
+    setTimeout(() => {
+        newTicket.classList.remove('opacity-0', 'scale-95');
+        newTicket.classList.add('opacity-100', 'scale-100');
+    }, 10);
+}
+
+// Function to remove a ticket from the UI
+function removeTicketFromUI(ticketId) {
+    const ticketElement = document.querySelector(`[data-ticket-id="${ticketId}"]`);
+    if (ticketElement) {
+        // Animate out the ticket
+        ticketElement.classList.add('opacity-0', 'scale-95', 'transform');
+        
+        setTimeout(() => {
+            ticketElement.remove();
+            
+            // Hide the header if no tickets remain
+            const ticketsList = document.getElementById('customTicketsList');
+            const ticketsHeader = document.getElementById('customTicketsHeader');
+            if (ticketsList.children.length === 0) {
+                ticketsHeader.style.display = 'none';
+            }
+        }, 300);
+    }
+}
+
+// Handle Enter key press in custom ticket form
+function handleCustomTicketKeypress(event) {
+    if (event.key === 'Enter') {
+        event.preventDefault();
+        addCustomTicketAjax();
+    }
+}
+
+// Fallback functions for backward compatibility
+function addCustomTicket() {
+    addCustomTicketAjax();
+}
+
+function removeCustomTicket(ticketId) {
+    removeCustomTicketAjax(ticketId);
+}
+
+// Product list: results come from PRODUCTS_URL and only visible rows are rendered
+const PRODUCT_ROW_HEIGHT = 56;
+const PRODUCT_PAGE_SIZE = 100;
+const PRODUCT_OVERSCAN_ROWS = 10;
+const SEARCH_DEBOUNCE_MS = 200;
+
+// Selections are tracked by id so they survive searching and scrolling
+const selectedProductIds = new Set();
+// Copies to print per selected product id; products not in here print once
+const productQuantities = new Map();
+let productQuery = '';
+let productTotal = 0;
+let productPages = new Map();
+let pendingProductPages = new Set();
+let productSearchGeneration = 0;
+
+function escapeHtml(value) {
+    return String(value)
+        .replace(/&/g, '&amp;')
+        .replace(/</g, '&lt;')
+        .replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;')
+        .replace(/'/g, '&#39;');
+}
+
+async function loadProductPage(pageIndex) {
+    if (productPages.has(pageIndex) || pendingProductPages.has(pageIndex)) {
+        return;
+    }
+    const generation = productSearchGeneration;
+    pendingProductPages.add(pageIndex);
+    
+    try {
+        const params = new URLSearchParams({
+            q: productQuery,
+            offset: pageIndex * PRODUCT_PAGE_SIZE,
+            limit: PRODUCT_PAGE_SIZE
+        });
+        const response = await fetch(`${PRODUCTS_URL}?${params}`);
+        const result = await response.json();
+        
+        // Ignore responses for a search that has since been replaced
+        if (generation !== productSearchGeneration) {
+            return;
+        }
+        productTotal = result.total;
+        productPages.set(pageIndex, result.products);
+        document.getElementById('resultCount').textContent = `${productTotal} matching`;
+        renderVisibleProducts();
+    } catch (error) {
+        console.error('Error loading products:', error);
+        showMessage('Network error loading products. Please check your connection and try again.', 'error');
+    } finally {
+        if (generation === productSearchGeneration) {
+            pendingProductPages.delete(pageIndex);
+        }
+    }
+}
+
+function productRowHTML(product, index) {
+    const isChecked = selectedProductIds.has(String(product.id));
+    const stateClasses = isChecked
+        ? 'border-[#89b4fa] bg-[#89b4fa]/10'
+        : 'border-transparent hover:border-[#89b4fa]';
+    const productId = escapeHtml(product.id);
+    const quantityInput = isChecked
+        ? `<input type="number" min="1" max="${MAX_TICKET_QUANTITY}" step="1" value="${productQuantities.get(String(product.id)) || 1}"
+                  title="Copies to print" class="w-20 px-2 py-1 border border-[#6c7086] bg-[#1e1e2e] text-white rounded-lg"
+                  onclick="event.stopPropagation()" onchange="setProductQuantity('${productId}', this.value)">`
+        : '';
+    return `
+        <div class="product-row absolute left-0 right-0 flex items-center gap-4 px-4 border-2 ${stateClasses} rounded-lg cursor-pointer transition-colors"
+             style="top: ${index * PRODUCT_ROW_HEIGHT}px; height: ${PRODUCT_ROW_HEIGHT - 4}px;"
+             onclick="toggleProduct('${productId}')">
+            <input type="checkbox" class="product-checkbox w-5 h-5 pointer-events-none" ${isChecked ? 'checked' : ''} tabindex="-1">
+            <span class="w-24 text-sm font-mono text-[#89b4fa] font-semibold">${escapeHtml(product.quick_code)}</span>
+            <span class="flex-grow text-sm text-gray-200 truncate">${escapeHtml(product.name)}</span>
+            ${quantityInput}
+            <span class="text-lg font-bold text-white">£${Number(product.rrp).toFixed(2)}</span>
+        </div>
+    `;
+}
+
+function renderVisibleProducts() {
+    const list = document.getElementById('productList');
+    const spacer = document.getElementById('productListSpacer');
+    if (!list) {
+        return;
+    }
+    spacer.style.height = `${productTotal * PRODUCT_ROW_HEIGHT}px`;
+    
+    const first = Math.max(0, Math.floor(list.scrollTop / PRODUCT_ROW_HEIGHT) - PRODUCT_OVERSCAN_ROWS);
+    const last = Math.min(productTotal, Math.ceil((list.scrollTop + list.clientHeight) / PRODUCT_ROW_HEIGHT) + PRODUCT_OVERSCAN_ROWS);
+    
+    const rows = [];
+    for (let index = first; index < last; index++) {
+        const pageIndex = Math.floor(index / PRODUCT_PAGE_SIZE);
+        const page = productPages.get(pageIndex);
+        if (!page) {
+            loadProductPage(pageIndex);
+            continue;
+        }
+        const product = page[index % PRODUCT_PAGE_SIZE];
+        if (product) {
+            rows.push(productRowHTML(product, index));
+        }
+    }
+    spacer.innerHTML = rows.join('');
+}
+
+function searchProducts(query) {
+    productQuery = query;
+    productTotal = 0;
+    productPages = new Map();
+    pendingProductPages = new Set();
+    productSearchGeneration++;
+    
+    const list = document.getElementById('productList');
+    if (list) {
+        list.scrollTop = 0;
+    }
+    loadProductPage(0);
+}
+
+function toggleProduct(productId) {
+    if (selectedProductIds.has(productId)) {
+        selectedProductIds.delete(productId);
+        productQuantities.delete(productId);
+    } else {
+        selectedProductIds.add(productId);
+    }
+    renderVisibleProducts();
+    updateCount();
+}
+
+function setProductQuantity(productId, value) {
+    const quantity = Math.min(MAX_TICKET_QUANTITY, Math.max(1, parseInt(value, 10) || 1));
+    if (quantity === 1) {
+        productQuantities.delete(productId);
+    } else {
+        productQuantities.set(productId, quantity);
+    }
+    renderVisibleProducts();
+    updateCount();
+}
+
+// Select every product matching the current search, not just the rows on screen
+async function selectAll() {
+    try {
+        const params = new URLSearchParams({ q: productQuery, ids_only: '1' });
+        const response = await fetch(`${PRODUCTS_URL}?${params}`);
+        const result = await response.json();
+        result.ids.forEach(id => selectedProductIds.add(String(id)));
+    } catch (error) {
+        console.error('Error selecting products:', error);
+        showMessage('Network error selecting products. Please check your connection and try again.', 'error');
+    }
+    renderVisibleProducts();
+    updateCount();
+}
+
+function deselectAll() {
+    selectedProductIds.clear();
+    productQuantities.clear();
+    renderVisibleProducts();
+    updateCount();
+}
+
+// Number of tickets that will be printed, counting quantities
+function ticketTotal() {
+    let total = 0;
+    selectedProductIds.forEach(id => { total += productQuantities.get(id) || 1; });
+    for (const ticket of document.getElementById('customTicketsList').children) {
+        total += Number(ticket.dataset.quantity) || 1;
+    }
+    return total;
+}
+
+function updateCount() {
+    const checkedCount = selectedProductIds.size;
+    const customCount = document.getElementById('customTicketsList').children.length;
+    const selected = checkedCount + customCount;
+    const total = ticketTotal();
+    document.getElementById('selectionCount').textContent =
+        total === selected ? `${selected} selected` : `${selected} selected (${total} tickets)`;
+}
+
+// Hidden form field with the given name and value
+function hiddenInput(name, value) {
+    const input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = name;
+    input.value = value;
+    return input;
+}
+
+// Write the selected ids into the form as product_ids[] fields, and quantities as quantity[<id>]
+function syncSelectedInputs() {
+    const container = document.getElementById('selectedProductInputs');
+    const fragment = document.createDocumentFragment();
+    selectedProductIds.forEach(id => {
+        fragment.appendChild(hiddenInput('product_ids[]', id));
+        if (productQuantities.has(id)) {
+            fragment.appendChild(hiddenInput(`quantity[${id}]`, productQuantities.get(id)));
+        }
+    });
+    container.replaceChildren(fragment);
+}
+
+function hideMessage() {
+    document.getElementById('generateMessage').classList.add('hidden');
+}
+
+function showMessage(text, type = 'success') {
+    const messageDiv = document.getElementById('generateMessage');
+    const messageContent = document.getElementById('messageContent');
+    const messageText = document.getElementById('messageText');
+    
+    // Set message text
+    messageText.textContent = text;
+    
+    // Set message styling based on type
+    messageContent.className = 'p-4 rounded-lg border flex items-center justify-between';
+    if (type === 'success') {
+        messageContent.classList.add('bg-green-900/30', 'border-green-500/50', 'text-green-200');
+    } else if (type === 'error') {
+        messageContent.classList.add('bg-red-900/30', 'border-red-500/50', 'text-red-200');
+    }
+    
+    // Show message
+    messageDiv.classList.remove('hidden');
+}
+
+// Handle form submission for PDF generation
+document.addEventListener('DOMContentLoaded', function() {
+    // Load the first page of products and the count on page load
+    const productList = document.getElementById('productList');
+    if (productList) {
+        productList.addEventListener('scroll', () => window.requestAnimationFrame(renderVisibleProducts));
+        window.addEventListener('resize', renderVisibleProducts);
+        searchProducts('');
+    }
+    
+    let searchTimer = null;
+    document.getElementById('productSearch').addEventListener('input', function(e) {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => searchProducts(e.target.value.trim()), SEARCH_DEBOUNCE_MS);
+    });
+    updateCount();
+    
+    // Handle PDF generation form submission
+    document.getElementById('ticketForm').addEventListener('submit', async function(e) {
+        syncSelectedInputs();
+        const checkedCount = selectedProductIds.size;
+        const customCount = document.getElementById('customTicketsList').children.length;
+        const totalCount = ticketTotal();
+        // Label printer output is small and quick to build, so it is always generated directly
+        const labelOutput = document.getElementById('output_format').value === 'zpl';
+        const useAsync = totalCount > ASYNC_TICKET_THRESHOLD && !labelOutput;
+        
+        if (checkedCount === 0 && customCount === 0) {
+            e.preventDefault();
+            showMessage('Please select at least one product or add a custom ticket!', 'error');
+            return;
+        }
+        
+        // If there are custom tickets, verify they're in the session before proceeding
+        if (customCount > 0 || useAsync) {
+            e.preventDefault(); // Prevent default submission temporarily
+        }
+        
+        if (customCount > 0) {
+            try {
+                // Only the count is fetched, so the check costs the same for any draft size
+                const sessionCheck = await fetch(CUSTOM_COUNT_URL);
+                const sessionData = await readJsonResponse(sessionCheck);
+                
+                if (sessionData.count !== customCount) {
+                    showMessage(`Session sync issue detected. Custom tickets in UI: ${customCount}, in session: ${sessionData.count}. Please try again.`, 'error');
+                    return;
+                }
+            } catch (error) {
+                console.error('Session check failed:', error);
+                showMessage('Session verification failed. Please try again.', 'error');
+                return;
+            }
+        }
+        
+        // Large selections are generated in the background so the request doesn't time out
+        if (useAsync) {
+            await generateInBackground(e.target, totalCount);
+            return;
+        }
+        
+        showMessage(labelOutput ? 'Generating label printer file...' : 'Generating PDF tickets...', 'success');
+        if (customCount > 0) {
+            // Session is synced, proceed with form submission
+            e.target.submit(); // Submit the form manually
+        }
+        
+        setTimeout(function() {
+            showMessage(`Successfully generated tickets for ${totalCount} products! Download should start automatically.`, 'success');
+        }, 1000);
+    });
+});
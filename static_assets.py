@@ -0,0 +1,134 @@
+"""
+Fingerprinted, precompressed static assets.
+
+Every file in the static folder is read once at startup. Each file gets:
+- a content hash, used both as its ETag and in a fingerprinted URL
+  (style.css -> style.3f9a1c2b7d4e.css) that can be cached for a year,
+  because a new version always gets a new URL
+- gzip and (if the brotli package is installed) brotli variants for text types
+
+Requests pick the smallest variant the client accepts. If-None-Match is
+answered with 304 Not Modified. Plain, unfingerprinted URLs keep working but
+must be revalidated on every use.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, abort, request
+
+
+# Fingerprinted URLs never change content, so clients may keep them this long
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Types worth compressing; images and fonts are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Hex digits of the content hash used in fingerprinted file names
+FINGERPRINT_LENGTH = 12
+
+# Content-Encoding values in order of preference, with the file suffix used in ETags
+ENCODINGS = (('br', 'br'), ('gzip', 'gz'))
+
+FINGERPRINTED_NAME = re.compile(r'^(?P<stem>.+)\.(?P<fingerprint>[0-9a-f]{%d})(?P<ext>\.[^./]+)$' % FINGERPRINT_LENGTH)
+
+
+def _brotli_compress(data):
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli.compress(data, quality=11)
+
+
+class StaticAsset:
+    """One static file: its bytes, precompressed variants and validators"""
+
+    def __init__(self, name, data):
+        self.name = name
+        self.data = data
+        digest = hashlib.sha256(data).hexdigest()
+        self.fingerprint = digest[:FINGERPRINT_LENGTH]
+        self.etag = digest[:32]
+        stem, ext = os.path.splitext(name)
+        self.fingerprinted_name = f'{stem}.{self.fingerprint}{ext}'
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        # Precompressed variants by Content-Encoding, kept only if they save space
+        self.variants = {}
+        if self.mimetype.startswith(COMPRESSIBLE_TYPES):
+            for encoding, compressed in (('gzip', gzip.compress(data, compresslevel=9, mtime=0)),
+                                         ('br', _brotli_compress(data))):
+                if compressed is not None and len(compressed) < len(data):
+                    self.variants[encoding] = compressed
+
+    def negotiate(self, accept_encodings):
+        """Return (content_encoding or None, body, etag) for the best variant the client accepts"""
+        for encoding, suffix in ENCODINGS:
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding, self.variants[encoding], f'{self.etag}-{suffix}'
+        return None, self.data, self.etag
+
+
+class StaticAssets:
+    """
+    All files in a static folder, loaded at startup. url_prefix is where the
+    assets are served, e.g. BASE_URL + '/static'.
+    """
+
+    def __init__(self, folder, url_prefix):
+        self.folder = folder
+        self.url_prefix = url_prefix.rstrip('/')
+        self.assets = {}
+        self._fingerprinted = {}
+        self.load()
+
+    def load(self):
+        """(Re)read every file in the folder"""
+        assets = {}
+        for root, _, files in os.walk(self.folder):
+            for filename in files:
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.folder).replace(os.sep, '/')
+                with open(path, 'rb') as f:
+                    assets[name] = StaticAsset(name, f.read())
+        self.assets = assets
+        self._fingerprinted = {asset.fingerprinted_name: asset for asset in assets.values()}
+
+    def url(self, name):
+        """Fingerprinted URL of an asset (the plain URL if there is no such file)"""
+        asset = self.assets.get(name)
+        return f'{self.url_prefix}/{asset.fingerprinted_name if asset else name}'
+
+    def lookup(self, name):
+        """Return (asset, fingerprinted) for a requested file name, or (None, False)"""
+        asset = self._fingerprinted.get(name)
+        if asset is not None:
+            return asset, True
+        match = FINGERPRINTED_NAME.match(name)
+        if match and name not in self.assets:
+            # An outdated fingerprint (e.g. a page cached before a deploy) gets the current file
+            asset = self.assets.get(match['stem'] + match['ext'])
+            return asset, False
+        return self.assets.get(name), False
+
+    def response(self, name):
+        """Response for GET/HEAD of a static file, honouring Accept-Encoding and If-None-Match"""
+        asset, fingerprinted = self.lookup(name)
+        if asset is None:
+            abort(404)
+        encoding, body, etag = asset.negotiate(request.accept_encodings)
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body, mimetype=asset.mimetype)
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        if fingerprinted:
+            response.headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response
@@ -0,0 +1,126 @@
+"""
+Memoized text layout for price tickets.
+
+Glyph widths, word widths, font metrics and wrapped lines are all cached, so
+laying out a product name that has been seen before costs a dictionary lookup
+instead of repeated stringWidth calls.
+"""
+from functools import lru_cache
+
+from reportlab.pdfbase import pdfmetrics
+
+
+# Maximum number of distinct (text, font, size, width) layouts kept in memory
+LAYOUT_CACHE_SIZE = 16384
+
+# Maximum number of distinct (word, font, size) widths kept in memory
+WORD_CACHE_SIZE = 65536
+
+# Gap between lines, as a fraction of the font size
+LEADING_RATIO = 0.2
+
+# Per-font glyph width tables (widths for a 1pt font), bounded by the font's character set
+_glyph_widths = {}
+
+
+def glyph_width(char, font_name):
+    """Width of a single character at 1pt, looked up from the font's cached table"""
+    table = _glyph_widths.get(font_name)
+    if table is None:
+        table = _glyph_widths.setdefault(font_name, {})
+    width = table.get(char)
+    if width is None:
+        width = table[char] = pdfmetrics.stringWidth(char, font_name, 1)
+    return width
+
+
+@lru_cache(maxsize=WORD_CACHE_SIZE)
+def word_width(word, font_name, font_size):
+    """Width of a word in points, cached per font and size"""
+    return sum(glyph_width(char, font_name) for char in word) * font_size
+
+
+@lru_cache(maxsize=None)
+def font_metrics(font_name, font_size):
+    """Return (ascent, descent, line_height) in points, descent as a positive number"""
+    ascent = pdfmetrics.getAscent(font_name, font_size)
+    descent = abs(pdfmetrics.getDescent(font_name, font_size))
+    return ascent, descent, ascent + descent
+
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def wrap_lines(text, font_name, font_size, max_width):
+    """
+    Greedily wrap text into lines no wider than max_width.
+    A single word wider than max_width is kept on its own line.
+    Returns a tuple of strings.
+    """
+    space = word_width(' ', font_name, font_size)
+    lines = []
+    current_line = []
+    current_width = 0
+
+    for word in text.split():
+        width = word_width(word, font_name, font_size)
+        test_width = current_width + space + width if current_line else width
+
+        if test_width <= max_width:
+            current_line.append(word)
+            current_width = test_width
+        else:
+            if current_line:
+                lines.append(' '.join(current_line))
+            current_line = [word]
+            current_width = width
+
+    if current_line:
+        lines.append(' '.join(current_line))
+
+    return tuple(lines)
+
+
+@lru_cache(maxsize=None)
+def block_baselines(line_count, font_name, font_size, section_height):
+    """
+    Baseline offsets, measured down from the top of a section, for a block of
+    line_count lines vertically centred in a section of the given height.
+    """
+    ascent, descent, line_height = font_metrics(font_name, font_size)
+    leading = font_size * LEADING_RATIO
+    total_height = line_count * line_height + (line_count - 1) * leading
+
+    # Space to leave above the text block to vertically center it
+    space_top = (section_height - total_height) / 2.0
+
+    # top_of_block = baseline + ascent => first baseline sits ascent below the block top
+    return tuple(space_top + ascent + i * (line_height + leading) for i in range(line_count))
+
+
+@lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def layout_text_block(text, font_name, font_size, max_width, section_height, max_lines=2):
+    """
+    Wrap text and centre up to max_lines of it vertically in a section.
+    Returns a tuple of (offset_from_section_top, line) pairs ready to draw.
+    """
+    lines = wrap_lines(text, font_name, font_size, max_width)[:max_lines]
+    baselines = block_baselines(len(lines), font_name, font_size, section_height)
+    return tuple(zip(baselines, lines))
+
+
+def layout_cache_info():
+    """Hit/miss statistics for the wrapped-line and text block caches"""
+    return {
+        'wrap_lines': wrap_lines.cache_info()._asdict(),
+        'layout_text_block': layout_text_block.cache_info()._asdict(),
+        'word_width': word_width.cache_info()._asdict(),
+    }
+
+
+def clear_layout_caches():
+    """Drop every cached width and layout (mainly useful for benchmarking)"""
+    _glyph_widths.clear()
+    word_width.cache_clear()
+    font_metrics.cache_clear()
+    wrap_lines.cache_clear()
+    block_baselines.cache_clear()
+    layout_text_block.cache_clear()
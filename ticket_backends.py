@@ -0,0 +1,261 @@
+"""
+Output backends for price tickets.
+
+Every backend prints the same tickets from the same layout
+(pdf_generator.ticket_field_layout and ticket_dividers). They differ only
+in what they emit:
+
+- pdf: the A4 sheet of tickets from generate_price_tickets()
+- zpl: commands for Zebra-compatible label printers, one label per ticket.
+  The logo is downloaded once per job as a stored graphic (~DG), and the
+  border, dividers and logo once as a stored format (^DF). Each label then
+  recalls that format and adds only its own text, with ^PQ for quantities.
+  Labels print as they arrive, without rasterising a PDF first.
+
+Backends write to a path or a binary file object, like generate_price_tickets().
+"""
+import os
+
+from PIL import Image
+
+from pdf_generator import (LOGO_PATH, TICKET_FONT_SIZE, generate_price_tickets, logo_box, ticket_dividers,
+                           ticket_field_layout, ticket_grid, ticket_quantity)
+
+
+# Printer resolutions ZPL printers come in (dots per inch)
+ZPL_DPIS = (203, 300, 600)
+
+# Names of the graphic and format stored in printer RAM for the duration of a job
+ZPL_LOGO_NAME = 'R:RUBILOGO.GRF'
+ZPL_FORMAT_NAME = 'R:RUBITKT.ZPL'
+
+# Logo pixels darker than this are printed
+ZPL_LOGO_THRESHOLD = 160
+
+# ZPL repeat counts: G-Y for 1-19, g-z for 20-400 in steps of 20
+_ZPL_SMALL_COUNTS = 'GHIJKLMNOPQRSTUVWXY'
+_ZPL_LARGE_COUNTS = 'ghijklmnopqrstuvwxyz'
+
+
+def _write_chunks(chunks, output_file):
+    """Write byte chunks to a path or binary file object; returns the bytes written"""
+    if hasattr(output_file, 'write'):
+        return sum(output_file.write(chunk) for chunk in chunks)
+    with open(output_file, 'wb') as f:
+        return sum(f.write(chunk) for chunk in chunks)
+
+
+class TicketBackend:
+    """
+    Base class for output formats. name selects the backend, extension and
+    mimetype describe its files. Subclasses implement render().
+    """
+    name = None
+    extension = None
+    mimetype = None
+
+    def render(self, products, output_file, progress=None, stats=None):
+        """
+        Write tickets for products (with optional 'quantity') to output_file.
+        Returns stats like generate_price_tickets(): tickets, bytes, bytes_per_ticket.
+        """
+        raise NotImplementedError
+
+
+class PdfBackend(TicketBackend):
+    """A4 sheets of tickets (generate_price_tickets)"""
+    name = 'pdf'
+    extension = 'pdf'
+    mimetype = 'application/pdf'
+
+    def __init__(self, **options):
+        # Passed through to generate_price_tickets, e.g. compact=True or workers=4
+        self.options = options
+
+    def render(self, products, output_file, progress=None, stats=None):
+        return generate_price_tickets(products, output_file, progress=progress, stats=stats, **self.options)
+
+
+def zpl_count(count):
+    """ZPL compression prefix for a character repeated count times (count <= 419)"""
+    prefix = ''
+    if count >= 20:
+        prefix += _ZPL_LARGE_COUNTS[count // 20 - 1]
+        count %= 20
+    if count:
+        prefix += _ZPL_SMALL_COUNTS[count - 1]
+    return prefix
+
+
+def zpl_compress_row(hex_row):
+    """
+    One row of graphic hex data in ZPL's ASCII compression scheme: runs become
+    a count prefix and the character, trailing zeros ',' and trailing F's '!'
+    """
+    suffix = ''
+    stripped = hex_row.rstrip('0')
+    if len(stripped) < len(hex_row):
+        suffix = ','
+    elif hex_row.endswith('FF'):
+        stripped = hex_row.rstrip('F')
+        suffix = '!'
+    if not stripped:
+        return suffix
+
+    parts = []
+    start = 0
+    while start < len(stripped):
+        char = stripped[start]
+        end = start + 1
+        while end < len(stripped) and stripped[end] == char and end - start < 419:
+            end += 1
+        run = end - start
+        parts.append(zpl_count(run) + char if run > 2 else char * run)
+        start = end
+    return ''.join(parts) + suffix
+
+
+def zpl_graphic(image):
+    """
+    A 1-bit PIL image as ~DG data: (total bytes, bytes per row, compressed hex).
+    Black pixels are printed.
+    """
+    width, height = image.size
+    row_bytes = (width + 7) // 8
+    # Pad each row to whole bytes; in mode '1' 0 is black, so invert for printed dots
+    padded = Image.new('1', (row_bytes * 8, height), 1)
+    padded.paste(image, (0, 0))
+    data = bytes(byte ^ 0xFF for byte in padded.tobytes())
+
+    rows = []
+    previous = None
+    for y in range(height):
+        hex_row = data[y * row_bytes:(y + 1) * row_bytes].hex().upper()
+        # ':' repeats the previous row
+        rows.append(':' if hex_row == previous else zpl_compress_row(hex_row))
+        previous = hex_row
+    return row_bytes * height, row_bytes, ''.join(rows)
+
+
+def zpl_field_data(text):
+    """(^FH command or '', escaped text) for a ^FD field"""
+    if not any(char in text for char in '_^~'):
+        return '', text
+    escaped = text.replace('_', '_5F').replace('^', '_5E').replace('~', '_7E')
+    return '^FH', escaped
+
+
+class ZplBackend(TicketBackend):
+    """Zebra ZPL II label printer commands, one label per ticket"""
+    name = 'zpl'
+    extension = 'zpl'
+    mimetype = 'application/vnd.zebra-zpl'
+
+    def __init__(self, dpi=203):
+        if dpi not in ZPL_DPIS:
+            raise ValueError(f'ZPL printers are {", ".join(map(str, ZPL_DPIS))} dpi, not {dpi}')
+        self.dpi = dpi
+        grid = ticket_grid()
+        self.ticket_width = grid['ticket_width']
+        self.ticket_height = grid['ticket_height']
+        self.label_width = self.dots(self.ticket_width)
+        self.label_height = self.dots(self.ticket_height)
+
+    def dots(self, points):
+        """Convert points (1/72 inch) to printer dots"""
+        return round(points * self.dpi / 72)
+
+    def _logo(self):
+        """(x, y, 1-bit image) of the logo placed like drawImage(preserveAspectRatio=True), or None"""
+        if not os.path.exists(LOGO_PATH):
+            return None
+        try:
+            image = Image.open(LOGO_PATH)
+            image.load()
+        except Exception:
+            return None
+        padding, available_width, available_height = logo_box(self.ticket_width, self.ticket_height)
+        scale = min(available_width / image.width, available_height / image.height)
+        width, height = image.width * scale, image.height * scale
+        left = padding + (available_width - width) / 2
+        top = padding + (available_height - height) / 2
+
+        image = image.convert('RGBA')
+        image = Image.alpha_composite(Image.new('RGBA', image.size, 'white'), image).convert('L')
+        image = image.resize((max(1, self.dots(width)), max(1, self.dots(height))), Image.LANCZOS)
+        image = image.point(lambda value: 255 if value >= ZPL_LOGO_THRESHOLD else 0, mode='1')
+        return self.dots(left), self.dots(top), image
+
+    def setup_commands(self):
+        """Label size, UTF-8, the logo graphic and the stored ticket format (sent once per job)"""
+        line = max(1, self.dots(1))
+        commands = [f'^XA^PW{self.label_width}^LL{self.label_height}^LH0,0^CI28^XZ\n']
+        logo = self._logo()
+        if logo is not None:
+            total, row_bytes, data = zpl_graphic(logo[2])
+            commands.append(f'~DG{ZPL_LOGO_NAME},{total},{row_bytes},{data}\n')
+
+        # The stored format: border, dividers, logo and the default font for the text
+        font_height = self.dots(TICKET_FONT_SIZE)
+        fields = [f'^XA^DF{ZPL_FORMAT_NAME}^FS', f'^CF0,{font_height}',
+                  f'^FO0,0^GB{self.label_width},{self.label_height},{line}^FS']
+        for x1, y1, x2, y2 in ticket_dividers(self.ticket_width, self.ticket_height):
+            # ZPL measures y down from the top; centre each line on its divider
+            left, top = self.dots(x1), self.label_height - self.dots(max(y1, y2))
+            if x1 == x2:
+                fields.append(f'^FO{left - line // 2},{top}^GB{line},{self.dots(abs(y2 - y1))},{line}^FS')
+            else:
+                fields.append(f'^FO{left},{top - line // 2}^GB{self.dots(x2 - x1)},{line},{line}^FS')
+        if logo is not None:
+            fields.append(f'^FO{logo[0]},{logo[1]}^XG{ZPL_LOGO_NAME},1,1^FS')
+        fields.append('^XZ\n')
+        commands.append(''.join(fields))
+        return commands
+
+    def label_commands(self, product):
+        """One label: recall the stored format, add the ticket's text, print quantity copies"""
+        parts = [f'^XA^XF{ZPL_FORMAT_NAME}^FS']
+        for x, baseline, text in ticket_field_layout(self.ticket_width, self.ticket_height, product):
+            escape, data = zpl_field_data(text)
+            parts.append(f'^FT{self.dots(x)},{self.label_height - self.dots(baseline)}{escape}^FD{data}^FS')
+        quantity = ticket_quantity(product)
+        if quantity > 1:
+            parts.append(f'^PQ{quantity}')
+        parts.append('^XZ\n')
+        return ''.join(parts)
+
+    def iter_commands(self, products, progress=None):
+        """
+        Yield the job as UTF-8 chunks: the setup, then one label per product.
+        progress is called as progress(tickets_done, labels_done).
+        """
+        for command in self.setup_commands():
+            yield command.encode('utf-8')
+        tickets_done = 0
+        for labels_done, product in enumerate(products, start=1):
+            yield self.label_commands(product).encode('utf-8')
+            tickets_done += ticket_quantity(product)
+            if progress:
+                progress(tickets_done, labels_done)
+
+    def render(self, products, output_file, progress=None, stats=None):
+        if stats is None:
+            stats = {}
+        written = _write_chunks(self.iter_commands(products, progress), output_file)
+        tickets = sum(ticket_quantity(product) for product in products)
+        stats['tickets'] = tickets
+        stats['labels'] = len(products)
+        stats['bytes'] = written
+        stats['bytes_per_ticket'] = written / tickets if tickets else 0.0
+        return stats
+
+
+OUTPUT_BACKENDS = {backend.name: backend for backend in (PdfBackend, ZplBackend)}
+
+
+def get_backend(name, **options):
+    """A backend instance by name ('pdf' or 'zpl'); raises ValueError for unknown names"""
+    backend = OUTPUT_BACKENDS.get(name)
+    if backend is None:
+        raise ValueError(f'Output format must be one of {", ".join(OUTPUT_BACKENDS)}, not {name!r}')
+    return backend(**options)
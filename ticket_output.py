@@ -0,0 +1,95 @@
+"""
+Output handling for generated ticket PDFs: in-memory rendering, chunked
+streaming, and unique on-disk files with a size/age-bounded retention sweep.
+"""
+import io
+import os
+import time
+import uuid
+from datetime import datetime
+
+from pdf_generator import generate_price_tickets
+
+
+# Supported values for the app's OUTPUT_MODE setting
+OUTPUT_MODES = ('memory', 'stream', 'disk')
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def render_pdf_bytes(tickets, **options):
+    """Render tickets into an in-memory PDF and return its bytes"""
+    buffer = io.BytesIO()
+    generate_price_tickets(tickets, buffer, **options)
+    return buffer.getvalue()
+
+
+def iter_chunks(data, chunk_size=STREAM_CHUNK_SIZE):
+    """Yield data in chunk_size pieces for a chunked HTTP response"""
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
+
+
+def download_name(prefix='price_tickets', extension='pdf'):
+    """Timestamped file name offered to the browser"""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return f'{prefix}_{timestamp}.{extension}'
+
+
+def unique_output_path(output_dir, prefix='price_tickets', extension='pdf'):
+    """
+    Path for a new output file that cannot collide with a concurrent request.
+    The timestamp keeps files sortable; the random suffix makes them unique.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return os.path.join(output_dir, f'{prefix}_{timestamp}_{uuid.uuid4().hex[:12]}.{extension}')
+
+
+def write_output_file(data, output_dir, prefix='price_tickets', extension='pdf'):
+    """Atomically write data to a new unique file in output_dir and return its path"""
+    os.makedirs(output_dir, exist_ok=True)
+    path = unique_output_path(output_dir, prefix, extension)
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+    return path
+
+
+def sweep_output_dir(output_dir, max_age_seconds=None, max_total_bytes=None, keep=()):
+    """
+    Delete generated files older than max_age_seconds, then the oldest remaining
+    files until the directory holds at most max_total_bytes. Paths in keep are
+    never removed. Returns the number of files deleted.
+    """
+    try:
+        entries = [entry for entry in os.scandir(output_dir) if entry.is_file()]
+    except FileNotFoundError:
+        return 0
+
+    keep = {os.path.abspath(path) for path in keep}
+    now = time.time()
+    files = []
+    for entry in entries:
+        stat = entry.stat()
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    # Oldest first
+    files.sort()
+
+    removed = 0
+    total_bytes = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        if os.path.abspath(path) in keep:
+            continue
+        too_old = max_age_seconds is not None and now - mtime > max_age_seconds
+        too_big = max_total_bytes is not None and total_bytes > max_total_bytes
+        if not (too_old or too_big):
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+        removed += 1
+    return removed
@@ -0,0 +1,313 @@
+"""
+Generate price tickets for many stores without going through the web app.
+
+Selections come from manifest files or the command line, and each store gets
+its own PDF in the output directory. Stores are rendered concurrently in a
+process pool; every worker process loads the catalog once and reuses it for
+all the stores it renders.
+
+Manifest formats (by file extension):
+    .txt   one store named after the file; one quick code per line, optionally
+           followed by a quantity ("57320 12"); # starts a comment
+    .csv   columns store, quick_code and optional quantity (QC/Qty/Copies also
+           work); without a store column the file is one store named after it
+    .json  {"store name": ["57320", {"quick_code": "57321", "quantity": 12}], ...}
+
+With --changed-since VERSION only products added or changed since that
+catalog version are printed (see catalog_history.py); stores with no changes
+are skipped. Without manifests, all changed products go into one PDF.
+
+Usage (from the repository root):
+    python tools/batch_generate.py manifests/*.txt --output-dir nightly/ --workers 4
+    python tools/batch_generate.py all_stores.csv --catalog-db products.sqlite3
+    python tools/batch_generate.py --codes store-001=57320,57321 --codes store-002=57322
+    python tools/batch_generate.py manifests/*.txt --changed-since 900466743c17e734
+"""
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+# Ensure repo root is on sys.path so imports work when running from tools/
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+from catalog import ProductCatalog, parse_quantity
+from catalog_history import CHANGE_KINDS, PRINTABLE_CHANGES, CatalogHistory, UnknownVersion, changed_product_ids
+from catalog_sqlite import SqliteProductCatalog
+from pdf_generator import generate_price_tickets
+
+# Store name used for all changed products when --changed-since has no manifests
+CHANGES_STORE = 'price_changes'
+
+# Header names accepted in CSV manifests
+STORE_COLUMNS = ('store', 'store_id', 'branch')
+QUICK_CODE_COLUMNS = ('quick_code', 'quickcode', 'qc')
+QUANTITY_COLUMNS = ('quantity', 'qty', 'copies')
+
+# Catalog of this process, loaded once by load_catalog()
+_catalog = None
+
+
+def load_catalog(catalog_path, catalog_db=None):
+    """Load the catalog for this process (the process pool initializer)"""
+    global _catalog
+    _catalog = SqliteProductCatalog(catalog_db) if catalog_db else ProductCatalog(catalog_path)
+    # Parse the JSON file now rather than in the first store's render
+    _catalog.refresh()
+
+
+def _column(row, names):
+    for key, value in row.items():
+        if key is not None and key.strip().lower().replace(' ', '_') in names:
+            return value
+    return None
+
+
+def read_text_manifest(path):
+    entries = []
+    with open(path, encoding='utf-8-sig') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            parts = line.replace(',', ' ').split()
+            entries.append((parts[0], parse_quantity(parts[1] if len(parts) > 1 else None)))
+    return {path.stem: entries}
+
+
+def read_csv_manifest(path):
+    stores = {}
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        for line_number, row in enumerate(csv.DictReader(f), start=2):
+            quick_code = (_column(row, QUICK_CODE_COLUMNS) or '').strip()
+            if not quick_code:
+                raise ValueError(f'{path}:{line_number}: quick_code is required')
+            store = (_column(row, STORE_COLUMNS) or '').strip() or path.stem
+            stores.setdefault(store, []).append((quick_code, parse_quantity(_column(row, QUANTITY_COLUMNS))))
+    return stores
+
+
+def read_json_manifest(path):
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    stores = {}
+    for store, items in data.items():
+        entries = stores.setdefault(str(store), [])
+        for item in items:
+            if isinstance(item, dict):
+                entries.append((str(item['quick_code']), parse_quantity(item.get('quantity'))))
+            else:
+                entries.append((str(item), 1))
+    return stores
+
+
+MANIFEST_READERS = {
+    '.txt': read_text_manifest,
+    '.csv': read_csv_manifest,
+    '.json': read_json_manifest,
+}
+
+
+def read_manifests(paths, inline_codes=()):
+    """Merge manifest files and --codes arguments into {store: [(quick_code, quantity), ...]}"""
+    stores = {}
+    for path in map(Path, paths):
+        reader = MANIFEST_READERS.get(path.suffix.lower())
+        if reader is None:
+            raise ValueError(f'{path}: manifests must be .txt, .csv or .json files')
+        for store, entries in reader(path).items():
+            stores.setdefault(store, []).extend(entries)
+    for spec in inline_codes:
+        store, _, codes = spec.partition('=')
+        if not store or not codes:
+            raise ValueError(f'--codes expects STORE=QC,QC,... not {spec!r}')
+        stores.setdefault(store, []).extend((code.strip(), 1) for code in codes.split(',') if code.strip())
+    check_output_names(stores)
+    return stores
+
+
+def check_output_names(stores):
+    """
+    Raise ValueError if two stores would be written to the same PDF, e.g.
+    "a b" and "a_b". Names are compared case-insensitively, as on macOS and
+    Windows file systems.
+    """
+    seen = {}
+    for store in stores:
+        file_name = os.path.basename(output_path('', store))
+        other = seen.setdefault(file_name.lower(), store)
+        if other != store:
+            raise ValueError(f'stores {other!r} and {store!r} would both be written to {file_name}; rename one')
+
+
+def output_path(output_dir, store):
+    """PDF path for a store, with characters that are unsafe in file names replaced"""
+    return os.path.join(output_dir, re.sub(r'[^A-Za-z0-9._-]+', '_', store) + '.pdf')
+
+
+def render_store(task):
+    """
+    Render one store's tickets with this process's catalog. Returns a result dict;
+    errors are reported in it rather than raised, so one bad store doesn't stop the run.
+    If only_ids is given, products with other ids are left out; entries=None
+    means every product in only_ids.
+    """
+    store, entries, path, strict, only_ids = task
+    start = time.perf_counter()
+    result = {'store': store, 'path': path, 'tickets': 0, 'pages': 0, 'missing': [], 'skipped': False,
+              'error': None}
+    try:
+        if entries is None:
+            products = _catalog.get_many(only_ids)
+        else:
+            products = []
+            for quick_code, quantity in entries:
+                product = _catalog.get_by_quick_code(quick_code)
+                if product is None:
+                    result['missing'].append(quick_code)
+                elif only_ids is None or str(product['id']) in only_ids:
+                    products.append(dict(product, quantity=quantity) if quantity > 1 else product)
+            if strict and result['missing']:
+                raise ValueError(f"{len(result['missing'])} quick codes are not in the catalog")
+            if not products and len(result['missing']) == len(entries):
+                raise ValueError('none of the quick codes are in the catalog')
+        if not products:
+            # Nothing changed for this store
+            result['skipped'] = True
+            result['seconds'] = time.perf_counter() - start
+            return result
+
+        temp_path = path + '.tmp'
+        stats = generate_price_tickets(products, temp_path)
+        os.replace(temp_path, path)
+        result['tickets'] = stats['tickets']
+        result['pages'] = stats['pages']
+    except Exception as e:
+        result['error'] = f'{type(e).__name__}: {e}'
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def record_catalog_version(history_path, catalog_path, catalog_db=None, since=None):
+    """
+    Record the current catalog version in the history, so later runs can use it
+    with --changed-since. Returns (version, ids of the products added or changed
+    since catalog version since, or None without since).
+    """
+    history = CatalogHistory(history_path)
+    catalog = SqliteProductCatalog(catalog_db) if catalog_db else ProductCatalog(catalog_path)
+    history.observe(catalog)
+    if since is None:
+        return catalog.version, None
+    diff = history.diff(since, catalog.version)
+    counts = ', '.join(f'{len(diff[kind])} {kind}' for kind in CHANGE_KINDS)
+    print(f"Catalog {since} -> {catalog.version}: {counts}")
+    return catalog.version, frozenset(changed_product_ids(diff, PRINTABLE_CHANGES))
+
+
+def run_batch(stores, output_dir, workers, catalog_path, catalog_db=None, strict=False, only_ids=None):
+    """Render every store, yielding result dicts as stores finish"""
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(store, entries, output_path(output_dir, store), strict, only_ids) for store, entries in stores.items()]
+    if workers <= 1:
+        load_catalog(catalog_path, catalog_db)
+        for task in tasks:
+            yield render_store(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=load_catalog,
+                             initargs=(catalog_path, catalog_db)) as executor:
+        futures = [executor.submit(render_store, task) for task in tasks]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Generate one price ticket PDF per store from manifests.')
+    parser.add_argument('manifests', nargs='*', help='.txt, .csv or .json manifest files')
+    parser.add_argument('--codes', action='append', default=[], metavar='STORE=QC,QC,...',
+                        help='quick codes for a store on the command line (repeatable)')
+    parser.add_argument('--output-dir', default='batch_tickets', help='directory for the per-store PDFs')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='stores rendered at once')
+    parser.add_argument('--catalog', default='products.json', help='JSON product catalog')
+    parser.add_argument('--catalog-db', help='use this SQLite catalog instead of the JSON file')
+    parser.add_argument('--strict', action='store_true', help='fail a store if any of its quick codes is unknown')
+    parser.add_argument('--summary', help='also write the run summary to this JSON file')
+    parser.add_argument('--changed-since', metavar='VERSION',
+                        help='only print products added or changed since this catalog version')
+    parser.add_argument('--history', default='catalog_history.sqlite3',
+                        help='catalog version history; every run records the current version in it')
+    args = parser.parse_args(argv)
+
+    try:
+        stores = read_manifests(args.manifests, args.codes)
+    except (OSError, ValueError, KeyError) as e:
+        parser.error(str(e))
+
+    try:
+        catalog_version, only_ids = record_catalog_version(args.history, args.catalog, args.catalog_db,
+                                                           args.changed_since)
+    except UnknownVersion:
+        parser.error(f'catalog version {args.changed_since} is not in {args.history}')
+    if args.changed_since and not stores:
+        stores = {CHANGES_STORE: None}
+    if not stores:
+        parser.error('no stores given; pass manifest files or --codes')
+
+    start = time.perf_counter()
+    results = []
+    for result in run_batch(stores, args.output_dir, args.workers, args.catalog, args.catalog_db, args.strict,
+                            only_ids):
+        results.append(result)
+        if result['error']:
+            status = 'FAILED ' + result['error']
+        elif result['skipped']:
+            status = 'no changes, skipped'
+        else:
+            status = f"{result['tickets']} tickets"
+        missing = f", {len(result['missing'])} unknown quick codes" if result['missing'] else ''
+        print(f"[{len(results)}/{len(stores)}] {result['store']}: {status}{missing} ({result['seconds']:.2f}s)")
+    elapsed = time.perf_counter() - start
+
+    failed = [result for result in results if result['error']]
+    tickets = sum(result['tickets'] for result in results)
+    summary = {
+        'stores': len(results),
+        'succeeded': len(results) - len(failed),
+        'failed': len(failed),
+        'skipped': sum(1 for result in results if result['skipped']),
+        'catalog_version': catalog_version,
+        'changed_since': args.changed_since,
+        'tickets': tickets,
+        'pages': sum(result['pages'] for result in results),
+        'seconds': elapsed,
+        'tickets_per_second': tickets / elapsed if elapsed else None,
+        'workers': args.workers,
+        'results': sorted(results, key=lambda result: result['store']),
+    }
+
+    print(f"\n{summary['succeeded']}/{summary['stores']} stores, {tickets} tickets, {summary['pages']} pages "
+          f"in {elapsed:.2f}s ({summary['tickets_per_second'] or 0:.0f} tickets/s, {args.workers} workers)")
+    print(f"  catalog version {catalog_version}")
+    if summary['skipped']:
+        print(f"  {summary['skipped']} stores had no changes since {args.changed_since}")
+    for result in failed:
+        print(f"  FAILED {result['store']}: {result['error']}")
+    unknown = sum(len(result['missing']) for result in results)
+    if unknown:
+        print(f"  {unknown} unknown quick codes skipped (see --summary for the list)")
+
+    if args.summary:
+        with open(args.summary, 'w') as f:
+            json.dump(summary, f, indent=2)
+        print(f"Summary written to {args.summary}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
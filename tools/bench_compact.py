@@ -0,0 +1,42 @@
+"""
+Compare PDF size and render time of default and compact output.
+
+Usage (from the repository root):
+    python tools/bench_compact.py [--tickets N ...] [--workers N]
+"""
+import argparse
+import io
+import sys
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path so imports work when running from tools/
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+from pdf_generator import generate_price_tickets
+from bench_ticket_template import build_products
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickets', type=int, nargs='+', default=[12, 500, 5000])
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print(f"{'tickets':>7} {'mode':>8} {'seconds':>8} {'bytes':>10} {'bytes/ticket':>13} {'saved':>7}")
+    for count in args.tickets:
+        products = build_products(count)
+        default_bytes = None
+        for compact in (False, True):
+            start = time.perf_counter()
+            stats = generate_price_tickets(products, io.BytesIO(), workers=args.workers, compact=compact)
+            elapsed = time.perf_counter() - start
+            default_bytes = default_bytes or stats['bytes']
+            saved = 1 - stats['bytes'] / default_bytes
+            print(f"{count:>7} {'compact' if compact else 'default':>8} {elapsed:>8.3f} {stats['bytes']:>10} "
+                  f"{stats['bytes_per_ticket']:>13.1f} {saved:>7.1%}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
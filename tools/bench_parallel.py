@@ -0,0 +1,76 @@
+"""
+Measure how parallel rendering scales with the number of worker processes.
+
+Every parallel run is also checked against the serial one: the page content
+streams must be byte-identical, including for a quantity run that crosses the
+chunk boundaries. Exits with status 1 on a mismatch.
+
+Usage (from the repository root):
+    python tools/bench_parallel.py [--tickets N] [--max-workers N]
+"""
+import argparse
+import io
+import os
+import sys
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path so imports work when running from tools/
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+from pypdf import PdfReader
+
+from pdf_generator import generate_price_tickets, ticket_grid
+from bench_ticket_template import build_products
+
+
+def page_streams(pdf_bytes):
+    """Decoded content stream of every page"""
+    return [page.get_contents().get_data() for page in PdfReader(io.BytesIO(pdf_bytes)).pages]
+
+
+def check_quantity_runs(workers):
+    """Render quantity runs that straddle one-page chunks serially and in parallel; True if the pages match"""
+    products = build_products(5)
+    per_page = ticket_grid()['tickets_per_page']
+    for i, product in enumerate(products):
+        product['quantity'] = per_page + 3 * i + 1
+    serial, parallel = io.BytesIO(), io.BytesIO()
+    generate_price_tickets(products, serial)
+    generate_price_tickets(products, parallel, workers=workers, chunk_pages=1)
+    return page_streams(serial.getvalue()) == page_streams(parallel.getvalue())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tickets', type=int, default=5000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    products = build_products(args.tickets)
+    print(f"{args.tickets} tickets, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'seconds':>9} {'tickets/s':>10} {'speedup':>8} {'bytes':>10} {'pages':>6}")
+    serial = serial_pages = None
+    mismatches = 0
+    for workers in range(1, args.max_workers + 1):
+        buffer = io.BytesIO()
+        start = time.perf_counter()
+        generate_price_tickets(products, buffer, workers=workers)
+        elapsed = time.perf_counter() - start
+        serial = serial or elapsed
+        pages = page_streams(buffer.getvalue())
+        serial_pages = serial_pages or pages
+        same = pages == serial_pages
+        mismatches += not same
+        print(f"{workers:>7} {elapsed:>9.3f} {args.tickets / elapsed:>10.0f} {serial / elapsed:>8.2f} "
+              f"{len(buffer.getvalue()):>10} {'same' if same else 'DIFFER':>6}")
+
+    quantity_runs_match = check_quantity_runs(max(2, args.max_workers))
+    print(f"quantity runs across chunks: {'same' if quantity_runs_match else 'DIFFER'}")
+    if mismatches or not quantity_runs_match:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
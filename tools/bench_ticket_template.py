@@ -0,0 +1,59 @@
+"""
+Compare the compiled ticket template (Form XObject) against redrawing the
+full ticket per product. Reports tickets/sec and PDF size for each mode.
+
+Usage (from the repository root):
+    python tools/bench_ticket_template.py [COUNT ...]
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path so imports work when running from tools/
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+from pdf_generator import generate_price_tickets
+
+DEFAULT_COUNTS = [60, 1000, 20000]
+
+
+def build_products(count):
+    """Build count sample products by cycling the real catalog"""
+    with open(BASE / 'products.json', 'r') as f:
+        base = json.load(f)
+    products = []
+    for i in range(count):
+        src = base[i % len(base)].copy()
+        src['quick_code'] = str(100000 + i)
+        src['rrp'] = round(9.99 + (i % 100), 2)
+        products.append(src)
+    return products
+
+
+def run(products, use_template):
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    generate_price_tickets(products, buffer, use_template=use_template)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(buffer.getvalue())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Compare the ticket template against per-ticket drawing.')
+    parser.add_argument('counts', metavar='COUNT', type=int, nargs='*', default=DEFAULT_COUNTS,
+                        help=f'ticket counts to benchmark (default {" ".join(map(str, DEFAULT_COUNTS))})')
+    counts = parser.parse_args(argv).counts
+    print(f"{'tickets':>8} {'mode':>9} {'seconds':>9} {'tickets/s':>10} {'bytes':>11} {'bytes/ticket':>13}")
+    for count in counts:
+        products = build_products(count)
+        for label, use_template in (('per-ticket', False), ('template', True)):
+            elapsed, size = run(products, use_template)
+            print(f"{count:>8} {label:>9} {elapsed:>9.3f} {count / elapsed:>10.0f} {size:>11} {size / count:>13.1f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,174 @@
+"""
+Benchmark the ticket PDF pipeline stage by stage on a synthetic catalog.
+
+Stages timed separately:
+    catalog_load  parse and index the catalog file, then look up the selection
+    layout        wrap and position every product name (cold layout caches)
+    draw          draw all tickets onto the canvas
+    save          serialize the canvas to PDF bytes
+
+Results (tickets/sec, peak RSS, PDF bytes, per-stage seconds) are printed and
+written as JSON so runs from different releases can be compared.
+
+Usage (from the repository root, no network needed):
+    python tools/benchmark.py --products 20000 --tickets 5000 --output results.json
+"""
+import argparse
+import io
+import json
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Ensure repo root is on sys.path so imports work when running from tools/
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+import reportlab
+from reportlab.pdfgen import canvas
+
+from catalog import ProductCatalog
+from pdf_generator import draw_ticket_pages, layout_ticket_name, ticket_grid
+from text_layout import clear_layout_caches
+
+# Word count ranges for synthetic product names
+NAME_LENGTHS = {
+    'short': (1, 3),
+    'mixed': (2, 8),
+    'long': (6, 16),
+}
+
+WORDS = [
+    'Premium', 'Drygres', 'Drill', 'Bit', 'Tile', 'Cutter', 'Diamond', 'Blade', 'Superpro',
+    'Conical', 'Easygres', 'Kit', 'Wet', 'Saw', 'Trowel', 'Notched', 'Spacer', 'Levelling',
+    'System', 'Grout', 'Float', 'Mixer', 'Paddle', 'Sponge', 'Bucket', 'Knee', 'Pads', 'Rail',
+    'Porcelain', 'Ceramic', 'Marble', 'Granite', 'Continuous', 'Turbo', 'Segmented', 'Rim',
+]
+
+
+def build_catalog(count, name_length, seed):
+    """Synthetic catalog of count products with names drawn from the given length distribution"""
+    rng = random.Random(seed)
+    min_words, max_words = NAME_LENGTHS[name_length]
+    products = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+        size = rng.choice([6, 8, 10, 12, 20, 35, 43, 50, 60, 115, 120])
+        products.append({
+            'id': i + 1,
+            'quick_code': str(100000 + i),
+            'rubi_code': str(rng.randint(1000, 99999)),
+            'name': f"{' '.join(words)} ({size}mm)",
+            'rrp': round(rng.uniform(1, 500), 2),
+        })
+    return products
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=BASE,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(products, tickets, seed, use_template):
+    """Run the pipeline once and return per-stage timings and sizes"""
+    stages = {}
+    grid = ticket_grid()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog_path = Path(tmp) / 'products.json'
+        catalog_path.write_text(json.dumps(products))
+        rng = random.Random(seed)
+        selected_ids = [rng.randint(1, len(products)) for _ in range(tickets)]
+
+        start = time.perf_counter()
+        catalog = ProductCatalog(str(catalog_path))
+        snapshot = catalog.snapshot()
+        # Duplicate ids are allowed in the selection, so look them up one by one
+        selection = [snapshot.by_id[str(product_id)] for product_id in selected_ids]
+        stages['catalog_load'] = time.perf_counter() - start
+
+    clear_layout_caches()
+    start = time.perf_counter()
+    for product in selection:
+        layout_ticket_name(product['name'], grid['ticket_width'], grid['ticket_height'])
+    stages['layout'] = time.perf_counter() - start
+
+    buffer = io.BytesIO()
+    c = canvas.Canvas(buffer, pagesize=(grid['page_width'], grid['page_height']))
+    start = time.perf_counter()
+    draw_ticket_pages(c, selection, grid, use_template)
+    stages['draw'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    c.save()
+    stages['save'] = time.perf_counter() - start
+
+    total = sum(stages.values())
+    return {
+        'stages': stages,
+        'total_seconds': total,
+        'tickets_per_second': tickets / total if total else None,
+        'pages': -(-tickets // grid['tickets_per_page']),
+        'pdf_bytes': len(buffer.getvalue()),
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Benchmark the ticket PDF pipeline stage by stage.')
+    parser.add_argument('--products', type=int, default=20000, help='synthetic catalog size')
+    parser.add_argument('--tickets', type=int, default=5000, help='tickets to generate per run')
+    parser.add_argument('--name-length', choices=sorted(NAME_LENGTHS), default='mixed',
+                        help='distribution of product name lengths')
+    parser.add_argument('--repeat', type=int, default=3, help='runs to perform; the fastest is reported')
+    parser.add_argument('--no-template', action='store_true', help='draw the full ticket for every product')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write machine-readable results to this JSON file')
+    args = parser.parse_args(argv)
+
+    products = build_catalog(args.products, args.name_length, args.seed)
+    runs = [run(products, args.tickets, args.seed, not args.no_template) for _ in range(args.repeat)]
+    best = min(runs, key=lambda result: result['total_seconds'])
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'reportlab': reportlab.Version,
+        'parameters': vars(args),
+        'best': best,
+        'runs': runs,
+    }
+
+    print(f"{args.tickets} tickets from a {args.products}-product catalog ({args.name_length} names), "
+          f"best of {args.repeat}")
+    for stage, seconds in best['stages'].items():
+        print(f"  {stage:<13} {seconds * 1000:>10.1f} ms")
+    print(f"  {'total':<13} {best['total_seconds'] * 1000:>10.1f} ms")
+    print(f"  tickets/sec   {best['tickets_per_second']:>10.0f}")
+    print(f"  pages         {best['pages']:>10}")
+    print(f"  PDF bytes     {best['pdf_bytes']:>10}")
+    print(f"  peak RSS      {best['peak_rss_kb'] / 1024:>10.1f} MB")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,44 @@
+"""
+Import supplier price files (CSV, JSON or JSON Lines) into the SQLite catalog.
+
+Rows are upserted on id if the file has an id column, otherwise on quick_code:
+new products are added, existing ones get the new name, Rubi code and RRP. Header names such as "QC", "Description" and
+"Price" are recognised as well as the products.json field names.
+
+Usage (from the repository root):
+    python tools/import_catalog.py products.sqlite3 prices.csv [more files ...]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+# Ensure repo root is on sys.path so imports work when running from tools/
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+from catalog_sqlite import DEFAULT_BATCH_SIZE, import_products
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Import price files into the SQLite product catalog.')
+    parser.add_argument('database', help='SQLite catalog file (created if missing)')
+    parser.add_argument('files', nargs='+', help='CSV, JSON or JSON Lines files to import')
+    parser.add_argument('--format', choices=['csv', 'json', 'jsonl'],
+                        help='file format (default: from the file extension)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='rows per transaction')
+    args = parser.parse_args(argv)
+
+    failed = False
+    for path in args.files:
+        summary = import_products(args.database, path, args.format, args.batch_size)
+        rate = summary['imported'] / summary['seconds'] if summary['seconds'] else 0
+        print(f"{path}: imported {summary['imported']} rows, skipped {summary['skipped']} "
+              f"in {summary['seconds']:.2f}s ({rate:.0f} rows/s)")
+        for error in summary['errors']:
+            print(f"  row {error['row']}: {error['error']}")
+        failed = failed or summary['skipped'] > 0
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,345 @@
+"""
+Load-test the web app with concurrent browser sessions.
+
+Each session has its own cookie jar and repeatedly runs one of these
+scenarios, picked at random by weight (--mix):
+    browse  load the page and search the product API
+    select  generate a PDF for a random selection of catalog products
+    custom  add custom tickets, check the session's draft holds exactly
+            those, generate, and check the PDF has them and the draft is empty
+
+Throughput, error rates and p50/p95/p99 latency are reported per endpoint.
+Each session's tickets are checked against what it asked for, so requests
+answered with another session's draft or output file count as
+consistency failures. With --output-mode disk, the PDFs written to the
+output directory are also counted against the successful generations, which
+catches file name collisions.
+
+By default the app runs in-process on a free localhost port, with its
+databases and output directory in a temporary directory. --url targets a
+server that is already running instead.
+
+Usage (from the repository root):
+    python tools/loadtest.py --sessions 16 --duration 30
+    python tools/loadtest.py --mix browse=1,select=2,custom=2 --output-mode disk
+    python tools/loadtest.py --url http://127.0.0.1:5002/rubi-price-ticket --sessions 32 --json results.json
+"""
+import argparse
+import http.client
+import http.cookiejar
+import io
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from pathlib import Path
+
+# Ensure repo root is on sys.path so imports work when running from tools/
+BASE = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE))
+
+SCENARIOS = ('browse', 'select', 'custom')
+DEFAULT_MIX = 'browse=2,select=2,custom=1'
+
+# Search words used by the browse scenario
+SEARCH_WORDS = ('', 'drill', 'bit', 'dry', 'diamond', '60', 'pads', 'cup')
+
+# Percentiles reported per endpoint
+PERCENTILES = (50, 95, 99)
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Report redirects (the app's error path for /generate) instead of following them"""
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Recorder:
+    """Thread-safe latencies, statuses and consistency failures per endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.failures = []
+        self.generated = 0
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies.setdefault(endpoint, []).append(seconds)
+            if not ok:
+                self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def fail(self, message):
+        with self._lock:
+            self.failures.append(message)
+
+    def count_generated(self):
+        with self._lock:
+            self.generated += 1
+
+
+class Session:
+    """One browser session: a cookie jar and the requests it makes"""
+
+    def __init__(self, base_url, recorder, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, endpoint, path, form=None, json_body=None, expect=200):
+        """Make a request and record it under endpoint. Returns (status, headers, body)."""
+        data = None
+        headers = {}
+        if json_body is not None:
+            data = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            data = urllib.parse.urlencode(form, doseq=True).encode('utf-8')
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, response_headers, body = response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            status, response_headers, body = e.code, e.headers, e.read()
+        except (OSError, http.client.HTTPException) as e:
+            # Refused or reset connections, timeouts and truncated bodies
+            self.recorder.record(endpoint, time.perf_counter() - start, False)
+            raise ConnectionError(f'{endpoint}: {e}') from e
+        self.recorder.record(endpoint, time.perf_counter() - start, status == expect)
+        return status, response_headers, body
+
+
+def _pdf_text(body):
+    from pypdf import PdfReader
+
+    return '\n'.join(page.extract_text() for page in PdfReader(io.BytesIO(body)).pages)
+
+
+def run_browse(session, rng, product_ids, label):
+    session.request('index', '/')
+    query = urllib.parse.urlencode({'q': rng.choice(SEARCH_WORDS), 'limit': 100})
+    session.request('api_products', f'/api/products?{query}')
+
+
+def run_select(session, rng, product_ids, label):
+    if not product_ids:
+        return
+    selection = rng.sample(product_ids, min(len(product_ids), rng.randint(1, 24)))
+    status, headers, body = session.request('generate', '/generate', form={'product_ids[]': selection})
+    if status == 200 and body.startswith(b'%PDF'):
+        session.recorder.count_generated()
+    elif status == 200:
+        session.recorder.fail(f'{label}: /generate returned {headers.get("Content-Type")}, not a PDF')
+
+
+def run_custom(session, rng, product_ids, label):
+    codes = [f'{label}-{index}' for index in range(rng.randint(1, 3))]
+    for code in codes:
+        session.request('add_custom', '/add_custom',
+                        json_body={'quick_code': code, 'name': f'Load test {code}', 'rrp': '9.99'})
+
+    status, _, body = session.request('session_debug', '/session_debug')
+    if status == 200:
+        in_draft = sorted(ticket['quick_code'] for ticket in json.loads(body)['custom_tickets'])
+        if in_draft != sorted(codes):
+            session.recorder.fail(f'{label}: draft holds {in_draft}, expected {sorted(codes)}')
+
+    status, _, body = session.request('generate', '/generate', form={})
+    if status != 200:
+        return
+    if not body.startswith(b'%PDF'):
+        session.recorder.fail(f'{label}: /generate did not return a PDF')
+        return
+    session.recorder.count_generated()
+    text = _pdf_text(body)
+    missing = [code for code in codes if code not in text]
+    if missing:
+        session.recorder.fail(f'{label}: PDF is missing {missing} (another session\'s output?)')
+
+    status, _, body = session.request('session_debug', '/session_debug')
+    if status == 200 and json.loads(body)['custom_tickets_count'] != 0:
+        session.recorder.fail(f'{label}: draft not cleared after generating')
+
+
+SCENARIO_RUNNERS = {'browse': run_browse, 'select': run_select, 'custom': run_custom}
+
+
+def parse_mix(spec):
+    """'browse=2,select=1' -> {'browse': 2, 'select': 1}"""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise ValueError(f'unknown scenario {name!r}; choose from {", ".join(SCENARIOS)}')
+        mix[name] = float(weight or 1)
+    if not any(weight > 0 for weight in mix.values()):
+        raise ValueError('the mix needs at least one scenario with a positive weight')
+    return mix
+
+
+def session_loop(number, base_url, recorder, mix, product_ids, deadline, iterations, timeout, seed):
+    """Run scenarios for one session until the deadline or iteration count is reached"""
+    rng = random.Random(seed + number)
+    session = Session(base_url, recorder, timeout)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    iteration = 0
+    while time.monotonic() < deadline and (iterations is None or iteration < iterations):
+        scenario = rng.choices(names, weights)[0]
+        try:
+            SCENARIO_RUNNERS[scenario](session, rng, product_ids, f'LT{number}x{iteration}')
+        except ConnectionError:
+            pass
+        except Exception as e:
+            recorder.fail(f'session {number}: {scenario} raised {type(e).__name__}: {e}')
+        iteration += 1
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def start_local_server(output_mode, workdir):
+    """Import the app with its state in workdir and serve it on a free localhost port"""
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    os.environ['OUTPUT_MODE'] = output_mode
+    os.environ['DRAFT_DB'] = os.path.join(workdir, 'drafts.sqlite3')
+    os.environ['CATALOG_HISTORY_DB'] = os.path.join(workdir, 'catalog_history.sqlite3')
+    os.chdir(BASE)
+    import app as web_app
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    web_app.OUTPUT_DIR = os.path.join(workdir, 'generated_tickets')
+    os.makedirs(web_app.OUTPUT_DIR, exist_ok=True)
+    server = make_server('127.0.0.1', 0, web_app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='loadtest-server', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}{web_app.BASE_URL}', web_app.OUTPUT_DIR
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='Load-test the ticket generator with concurrent sessions.')
+    parser.add_argument('--url', help='base URL of a running server (default: start the app in-process)')
+    parser.add_argument('--sessions', type=int, default=8, help='concurrent sessions')
+    parser.add_argument('--duration', type=float, default=20, help='seconds to run')
+    parser.add_argument('--iterations', type=int, help='stop each session after this many scenarios')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'scenario weights (default {DEFAULT_MIX})')
+    parser.add_argument('--output-mode', choices=('memory', 'stream', 'disk'), default='disk',
+                        help='OUTPUT_MODE of the in-process app (default disk, to check file names)')
+    parser.add_argument('--output-dir', help='with --url: the server\'s output directory, to count its files')
+    parser.add_argument('--timeout', type=float, default=60, help='per-request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this JSON file')
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    server = None
+    workdir = tempfile.TemporaryDirectory(prefix='ticket-loadtest-')
+    if args.url:
+        base_url, output_dir = args.url, args.output_dir
+    else:
+        server, base_url, output_dir = start_local_server(args.output_mode, workdir.name)
+    files_before = set(os.listdir(output_dir)) if output_dir else set()
+
+    recorder = Recorder()
+    setup = Session(base_url, Recorder(), args.timeout)
+    _, _, body = setup.request('api_products', '/api/products?ids_only=1')
+    product_ids = json.loads(body).get('ids', [])
+
+    print(f"{args.sessions} sessions for {args.duration:g}s against {base_url} "
+          f"({len(product_ids)} products, mix {args.mix})")
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=session_loop, args=(number, base_url, recorder, mix, product_ids, deadline,
+                                                           args.iterations, args.timeout, args.seed))
+               for number in range(args.sessions)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        latencies = sorted(latencies)
+        errors = recorder.errors.get(endpoint, 0)
+        endpoints[endpoint] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': errors / len(latencies),
+            'requests_per_second': len(latencies) / elapsed,
+            **{f'p{p}': percentile(latencies, p) for p in PERCENTILES},
+            'max': latencies[-1],
+        }
+    total = sum(stats['requests'] for stats in endpoints.values())
+    total_errors = sum(stats['errors'] for stats in endpoints.values())
+
+    output_files = None
+    if output_dir and (server is None or args.output_mode == 'disk'):
+        output_files = len(set(os.listdir(output_dir)) - files_before)
+        if output_files < recorder.generated:
+            recorder.fail(f'{recorder.generated} PDFs generated but only {output_files} new files in '
+                          f'{output_dir}: output file names collided')
+
+    print(f"\n{'endpoint':<14} {'requests':>8} {'req/s':>7} {'errors':>7} "
+          + ' '.join(f'{f"p{p} ms":>8}' for p in PERCENTILES) + f" {'max ms':>8}")
+    for endpoint, stats in endpoints.items():
+        print(f"{endpoint:<14} {stats['requests']:>8} {stats['requests_per_second']:>7.1f} "
+              f"{stats['error_rate']:>7.1%} "
+              + ' '.join(f"{stats[f'p{p}'] * 1000:>8.1f}" for p in PERCENTILES) + f" {stats['max'] * 1000:>8.1f}")
+    print(f"\n{total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s), "
+          f"{total_errors} errors ({total_errors / total if total else 0:.1%}), {recorder.generated} PDFs")
+    if output_files is not None:
+        print(f"  {output_files} new files in the output directory")
+    for failure in recorder.failures[:20]:
+        print(f"  FAILED {failure}")
+    if len(recorder.failures) > 20:
+        print(f"  ... and {len(recorder.failures) - 20} more consistency failures")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({
+                'url': base_url,
+                'sessions': args.sessions,
+                'seconds': elapsed,
+                'mix': mix,
+                'requests': total,
+                'errors': total_errors,
+                'requests_per_second': total / elapsed,
+                'pdfs_generated': recorder.generated,
+                'output_files': output_files,
+                'failures': recorder.failures,
+                'endpoints': endpoints,
+            }, f, indent=2)
+        print(f"Results written to {args.json}")
+
+    if server is not None:
+        server.shutdown()
+    workdir.cleanup()
+    return 1 if recorder.failures or total_errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
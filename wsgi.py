@@ -1,4 +1,24 @@
-from app import app
+"""
+WSGI entry point.
+
+In production run it under gunicorn with the settings in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+`python wsgi.py` does the same; `python app.py` is the single-process
+development server.
+"""
+import os
+import sys
 
 if __name__ == '__main__':
-    app.run(debug=False, port=5002)
+    # gunicorn imports the app itself, after its config has set up the environment
+    from gunicorn.app.wsgiapp import run
+
+    config = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gunicorn.conf.py')
+    sys.argv = [sys.argv[0], '--config', config, 'wsgi:application'] + sys.argv[1:]
+    sys.exit(run())
+else:
+    from app import app
+
+    application = app